@@ -0,0 +1,22 @@
+import logging
+from django.db import connections
+from django.db.utils import DatabaseError
+from django.http import JsonResponse
+
+logger = logging.getLogger(__name__)
+
+def healthz(request):
+    """Liveness: the process is up and serving requests."""
+    return JsonResponse({'status': 'ok'})
+
+def readyz(request):
+    """Readiness: every configured database answers a trivial query."""
+    for alias in connections:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except DatabaseError:
+            # The error can name hosts and users, so it goes to the log only
+            logger.exception('Database %s is unavailable', alias)
+            return JsonResponse({'status': 'unavailable', 'database': alias}, status=503)
+    return JsonResponse({'status': 'ok'})
@@ -11,7 +11,8 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 from pathlib import Path
-import os, time, django
+import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -20,13 +21,21 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.0/howto/deployment/checklist/
 
+# Every deployment-specific setting can be overridden from the environment;
+# the defaults are the development values.
+def env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+def env_list(name, default):
+    return [item.strip() for item in os.environ.get(name, default).split(',') if item.strip()]
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-ho=x+99lbhcpxf%je6!+i4$1u%4_ew0ua$d#0ga3sm&9mc86*8'
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', 'django-insecure-ho=x+99lbhcpxf%je6!+i4$1u%4_ew0ua$d#0ga3sm&9mc86*8')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = env_bool('DJANGO_DEBUG', True)
 
-ALLOWED_HOSTS = ['*']
+ALLOWED_HOSTS = env_list('DJANGO_ALLOWED_HOSTS', '*')
 
 CORS_ALLOW_ALL_ORIGINS = True
 
@@ -51,6 +60,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the stack
+    'LittleLemonAPI.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
 
@@ -88,17 +99,79 @@ WSGI_APPLICATION = 'LittleLemon.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
+DB_ENGINE = os.environ.get('DB_ENGINE', 'postgresql')
+
+if DB_ENGINE == 'sqlite3':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'littlelemon_db'),
+            'USER': os.environ.get('POSTGRES_USER', 'littlelemon_user'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'littlelemon_password'),
+            'HOST': os.environ.get('POSTGRES_HOST', 'db'),
+            'PORT': int(os.environ.get('POSTGRES_PORT', 5432)),
+            # Keep connections open between requests and check them before
+            # reuse. Set DB_CONN_MAX_AGE=0 under ASGI, where connections are
+            # not reused across requests, and let PgBouncer do the pooling.
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            # Required behind PgBouncer in transaction pooling mode.
+            'DISABLE_SERVER_SIDE_CURSORS': env_bool('DB_DISABLE_SERVER_SIDE_CURSORS', False),
+        }
+    }
+
+# Cache shared by every worker when CACHE_BACKEND/CACHE_LOCATION are set,
+# e.g. django.core.cache.backends.redis.RedisCache; per-process otherwise,
+# which only suits a single worker (manage.py check --deploy warns).
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'littlelemon_db',
-        'USER': 'littlelemon_user',
-        'PASSWORD': 'littlelemon_password',
-        'HOST': 'db',
-        'PORT': 5432
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
     }
 }
 
+# Where throttle counters live: CacheThrottleStore is exact across workers
+# with a shared cache, DatabaseThrottleStore with the database alone.
+THROTTLE_STORE = os.environ.get('THROTTLE_STORE', 'LittleLemonAPI.throttles.CacheThrottleStore')
+
+# Delivers order events to the streams open in this process only. Use
+# LittleLemonAPI.events.DatabaseBroker when running more than one worker.
+ORDER_EVENTS_BROKER = os.environ.get('ORDER_EVENTS_BROKER', 'LittleLemonAPI.events.InProcessBroker')
+
+# The rendered /api/menu/snapshot files, shared by the workers of a host.
+MENU_SNAPSHOT_DIR = os.environ.get('MENU_SNAPSHOT_DIR', os.path.join(tempfile.gettempdir(), 'littlelemon-menu'))
+
+# Server-Timing headers, the slow request log and the /api/metrics histograms.
+# Requests slower than METRICS_SLOW_REQUEST_MS are logged with their slowest query.
+METRICS_ENABLED = env_bool('METRICS_ENABLED', True)
+METRICS_SLOW_REQUEST_MS = int(os.environ.get('METRICS_SLOW_REQUEST_MS', 500))
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 10))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'LittleLemon': {
+            'handlers': ['console'],
+            'level': os.environ.get('LITTLELEMON_LOG_LEVEL', 'WARNING'),
+        },
+        'LittleLemonAPI': {
+            'handlers': ['console'],
+            'level': os.environ.get('LITTLELEMON_LOG_LEVEL', 'WARNING'),
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -140,22 +213,6 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-DATABASE_READY = False
-
-# At startup
-while not DATABASE_READY:
-  try:
-    django.db.connections['default'].ensure_connection()
-  except Exception:
-    time.sleep(1)
-  else:
-    DATABASE_READY = True
-
-# Run migrations now
-if not DATABASE_READY:
-  print('Applying migrations...')
-  os.system('python manage.py migrate')
-
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         'rest_framework.filters.OrderingFilter',
@@ -167,19 +224,32 @@ REST_FRAMEWORK = {
     'MAX_ORDERS_PER_PAGE' : 4,
 
     'DEFAULT_THROTTLE_CLASSES': (
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'LittleLemonAPI.throttles.AnonRateThrottle',
+        'LittleLemonAPI.throttles.UserRateThrottle',
     ),
 
     'DEFAULT_THROTTLE_RATES': {
-        'anon': '30/minute',
-        'user': '60/minute',
-        'fifteen': '15/minute',
+        'anon': os.environ.get('THROTTLE_ANON_RATE', '30/minute'),
+        'user': os.environ.get('THROTTLE_USER_RATE', '60/minute'),
+        'fifteen': os.environ.get('THROTTLE_FIFTEEN_RATE', '15/minute'),
     },
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
-    )
+        'LittleLemonAPI.authentication.CachedTokenAuthentication',
+    ),
+
+    'DEFAULT_RENDERER_CLASSES': (
+        'LittleLemonAPI.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'LittleLemonAPI.renderers.MessagePackRenderer',
+    ),
+
+    'DEFAULT_PARSER_CLASSES': (
+        'LittleLemonAPI.renderers.ORJSONParser',
+        'LittleLemonAPI.renderers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 DJOSER = {
@@ -16,8 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from . import health
 
 urlpatterns = [
+    path('healthz', health.healthz, name='healthz'),
+    path('readyz', health.readyz, name='readyz'),
     path('admin/', admin.site.urls),
     path('api/', include('LittleLemonAPI.urls')),
     path('api/auth/', include('djoser.urls')),
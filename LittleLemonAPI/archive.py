@@ -0,0 +1,146 @@
+"""Moving delivered orders out of the hot Order/OrderItem tables.
+
+Order lists, reports and checkout only ever need recent orders and the
+ones still open, so archive_orders moves delivered orders older than
+ORDER_ARCHIVE_AFTER_DAYS into ArchivedOrder/ArchivedOrderItem, keeping
+their ids. The hot tables and their indexes then stay the size of the
+working set however much history there is. On PostgreSQL the archive is
+partitioned by month, so a date filter on it only reads the months asked
+for.
+
+Order lists read the archive as well only when they are given a date
+filter (date, start or end). A single order is looked up in the archive
+when it is not in the hot table. The sales rollups keep counting archived
+orders, and rebuild_rollups() reads both tables.
+"""
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .fast_serializers import order_rows
+from .filters import ORDER_DEFAULT_ORDERING, filter_orders, order_by, scope_orders
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+ORDER_ARCHIVE_AFTER_DAYS = getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 90)
+ORDER_ARCHIVE_BATCH_SIZE = getattr(settings, 'ORDER_ARCHIVE_BATCH_SIZE', 1000)
+
+# Query parameters that make an order list read the archive too
+ARCHIVE_FILTERS = ('date', 'start', 'end')
+
+def month_start(moment):
+    moment = moment.astimezone(dt_timezone.utc)
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def next_month(moment):
+    return month_start(moment + timedelta(days=32))
+
+def ensure_partitions(first, last):
+    """Create the monthly ArchivedOrder partitions covering first to last, on PostgreSQL."""
+    if connection.vendor != 'postgresql':
+        return
+    qn = connection.ops.quote_name
+    table = ArchivedOrder._meta.db_table
+    month = month_start(first)
+    with connection.cursor() as cursor:
+        while month <= last:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {qn(f"{table}_{month:%Y%m}")} PARTITION OF {qn(table)} '
+                f'FOR VALUES FROM (%s) TO (%s)',
+                [month, next_month(month)],
+            )
+            month = next_month(month)
+
+def _move(source, target, key, ids):
+    """INSERT ... SELECT the rows whose key is in ids from source into target, then delete them from source."""
+    qn = connection.ops.quote_name
+    columns = ', '.join(qn(field.column) for field in target._meta.local_fields)
+    placeholders = ', '.join(['%s'] * len(ids))
+    where = f'WHERE {qn(key)} IN ({placeholders})'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {qn(target._meta.db_table)} ({columns}) SELECT {columns} FROM {qn(source._meta.db_table)} {where}', ids,
+        )
+        # A raw delete: no pre_delete signal takes the orders out of the rollups
+        cursor.execute(f'DELETE FROM {qn(source._meta.db_table)} {where}', ids)
+
+def archive_orders(before, batch_size=ORDER_ARCHIVE_BATCH_SIZE):
+    """Move delivered orders dated before `before` to the archive, oldest first.
+
+    Each batch moves its orders and their items in one transaction, so
+    stopping at any point leaves every order in exactly one place and a
+    new run carries on where the last one stopped. Yields the number of
+    orders moved by every batch as it is committed.
+    """
+    while True:
+        with transaction.atomic():
+            batch = list(
+                Order.objects.select_for_update(skip_locked=True)
+                .filter(status=True, date__lt=before)
+                .order_by('date', 'id').values_list('id', 'date')[:batch_size]
+            )
+            if not batch:
+                return
+            ids = [pk for pk, _ in batch]
+            ensure_partitions(batch[0][1], batch[-1][1])
+            # Items first: they reference the orders
+            _move(OrderItem, ArchivedOrderItem, 'order_id', ids)
+            _move(Order, ArchivedOrder, 'id', ids)
+        yield len(ids)
+
+def vacuum_hot_tables():
+    """On PostgreSQL, reclaim the space of the moved rows now rather than at the next autovacuum.
+
+    Until then the order indexes still hold entries for every archived
+    row, and scans of the hot table keep skipping over them. VACUUM cannot
+    run in a transaction, so inside one this leaves it to autovacuum.
+    """
+    if connection.vendor != 'postgresql' or connection.in_atomic_block:
+        return
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for model in (Order, OrderItem):
+            cursor.execute(f'VACUUM (ANALYZE) {qn(model._meta.db_table)}')
+
+def archive_cutoff(days=ORDER_ARCHIVE_AFTER_DAYS):
+    return timezone.now() - timedelta(days=days)
+
+def reads_archive(query_params):
+    return any(query_params.get(name) for name in ARCHIVE_FILTERS)
+
+def order_sources(user, roles, query_params):
+    """The filtered orders an order list reads: the hot table, and the archive when a date filter is given."""
+    sources = [filter_orders(scope_orders(user, roles), query_params)]
+    if reads_archive(query_params):
+        sources.append(filter_orders(scope_orders(user, roles, ArchivedOrder), query_params))
+    return sources
+
+def order_detail_sources(user, roles):
+    """Where one order is looked up by id: the hot table, then the archive."""
+    return [scope_orders(user, roles), scope_orders(user, roles, ArchivedOrder)]
+
+def order_by_id(sources, pk):
+    """(order, archived) for the order with id pk in the first source that has it, (None, False) if none does.
+
+    Archived orders keep their ids, so an id is in one table or the other.
+    """
+    for index, source in enumerate(sources):
+        order = source.filter(pk=pk).first()
+        if order is not None:
+            return order, index > 0
+    return None, False
+
+async def aorder_by_id(sources, pk):
+    for index, source in enumerate(sources):
+        order = await source.filter(pk=pk).afirst()
+        if order is not None:
+            return order, index > 0
+    return None, False
+
+def order_source_rows(sources, ordering=None):
+    """order_rows.values() of every source as one queryset, in the list's ordering."""
+    rows = [order_rows.values(source) for source in sources]
+    if len(rows) == 1:
+        return rows[0]
+    # A UNION ALL of the unordered parts, ordered as a whole
+    union = rows[0].order_by().union(*(part.order_by() for part in rows[1:]), all=True)
+    return union.order_by(*order_by(ordering or ORDER_DEFAULT_ORDERING))
@@ -0,0 +1,116 @@
+import heapq
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Q
+from rest_framework import serializers
+from .events import ORDER_ASSIGNED, publish_order_events
+from .models import Order
+from .roles import DELIVERY_CREW
+from .rollups import record_assignments
+
+ORDER_ASSIGNMENT_BATCH_SIZE = getattr(settings, 'ORDER_ASSIGNMENT_BATCH_SIZE', 1000)
+# Most orders a single auto-assignment hands out
+ORDER_AUTO_ASSIGN_LIMIT = getattr(settings, 'ORDER_AUTO_ASSIGN_LIMIT', 500)
+
+# Enough of an order to assign it, count it in the rollups and publish its event
+ASSIGNMENT_FIELDS = ('id', 'user_id', 'delivery_crew_id', 'status', 'date')
+
+class AssignmentSerializer(serializers.Serializer):
+    order_id = serializers.IntegerField(min_value=1)
+    delivery_crew_id = serializers.IntegerField(min_value=1)
+
+class AutoAssignSerializer(serializers.Serializer):
+    auto = serializers.BooleanField()
+    limit = serializers.IntegerField(min_value=1, max_value=ORDER_AUTO_ASSIGN_LIMIT, default=ORDER_AUTO_ASSIGN_LIMIT)
+
+def save_assignments(changes):
+    """Write the new delivery crews of (order, previous_crew_id) pairs, count them and publish them."""
+    Order.objects.bulk_update([order for order, _ in changes], ['delivery_crew'], batch_size=ORDER_ASSIGNMENT_BATCH_SIZE)
+    record_assignments(changes)
+    publish_order_events([order for order, _ in changes], ORDER_ASSIGNED)
+
+def report(changes):
+    return {'assigned': [{'id': order.pk, 'delivery_crew_id': order.delivery_crew_id} for order, _ in changes]}
+
+def assign_orders(rows):
+    """Assign each {order_id, delivery_crew_id} row, all or nothing, and return (ok, report).
+
+    The crew members are checked with one query and the orders locked and
+    read with another, in id order so concurrent assignments lock them in
+    the same order. Nothing is written unless every row is valid; the
+    errors are reported per row instead.
+    """
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        return False, {'message': 'Expected a list of {"order_id", "delivery_crew_id"} objects'}
+    errors, valid = [], []
+    serializer = AssignmentSerializer()
+    for row_number, row in enumerate(rows, start=1):
+        try:
+            valid.append((row_number, serializer.run_validation(row)))
+        except serializers.ValidationError as exc:
+            errors.append({'row': row_number, 'errors': exc.detail})
+
+    crew_ids = {data['delivery_crew_id'] for _, data in valid}
+    crew = set(User.objects.filter(pk__in=crew_ids, groups__name=DELIVERY_CREW).values_list('pk', flat=True)) if crew_ids else set()
+    with transaction.atomic():
+        order_ids = {data['order_id'] for _, data in valid}
+        orders = {}
+        if order_ids:
+            locked = Order.objects.select_for_update().filter(pk__in=order_ids).order_by('pk').only(*ASSIGNMENT_FIELDS)
+            orders = {order.pk: order for order in locked}
+        changes, seen = [], set()
+        for row_number, data in valid:
+            row_errors = {}
+            if data['order_id'] not in orders:
+                row_errors['order_id'] = ['Order not found']
+            elif data['order_id'] in seen:
+                row_errors['order_id'] = ['Order listed more than once']
+            if data['delivery_crew_id'] not in crew:
+                row_errors['delivery_crew_id'] = ['Invalid delivery crew']
+            seen.add(data['order_id'])
+            if row_errors:
+                errors.append({'row': row_number, 'errors': row_errors})
+                continue
+            order = orders[data['order_id']]
+            changes.append((order, order.delivery_crew_id))
+            order.delivery_crew_id = data['delivery_crew_id']
+        if errors:
+            return False, {'message': 'Assignment failed, nothing was saved', 'errors': sorted(errors, key=lambda error: error['row'])}
+        save_assignments(changes)
+    return True, report(changes)
+
+def crew_loads():
+    """(open orders, user id) of every delivery crew member, in one aggregate query."""
+    members = User.objects.filter(groups__name=DELIVERY_CREW).annotate(
+        open_orders=Count('delivery_crew', filter=Q(delivery_crew__status=False)),
+    )
+    return [(open_orders, pk) for pk, open_orders in members.values_list('pk', 'open_orders')]
+
+def auto_assign(limit=ORDER_AUTO_ASSIGN_LIMIT):
+    """Give the oldest unassigned, undelivered orders to the delivery crew with the fewest open orders.
+
+    Each order goes to whoever has the fewest open orders at that point,
+    lowest user id first on ties. Orders another auto-assignment has locked
+    are skipped rather than waited for, so concurrent runs split the
+    backlog between them. Returns (ok, report).
+    """
+    loads = crew_loads()
+    if not loads:
+        return False, {'message': 'There is no delivery crew to assign orders to'}
+    heapq.heapify(loads)
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(delivery_crew__isnull=True, status=False)
+            .order_by('date', 'id').only(*ASSIGNMENT_FIELDS)[:limit]
+        )
+        changes = []
+        for order in orders:
+            open_orders, crew_id = heapq.heappop(loads)
+            changes.append((order, None))
+            order.delivery_crew_id = crew_id
+            heapq.heappush(loads, (open_orders + 1, crew_id))
+        if changes:
+            save_assignments(changes)
+    return True, report(changes)
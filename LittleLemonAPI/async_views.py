@@ -0,0 +1,251 @@
+import asyncio
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.core.paginator import InvalidPage
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.translation import gettext_lazy as _
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.authentication import get_authorization_header
+from rest_framework.authtoken.models import Token
+from rest_framework.filters import OrderingFilter
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+from . import events
+from .authentication import token_cache
+from .caching import CATALOG_CACHE_TIMEOUT, CatalogCacheMixin, etag_matches, get_etag
+from .archive import aorder_by_id, order_detail_sources, order_source_rows, order_sources
+from .filters import MenuItemFilter
+from .fast_serializers import menu_item_rows, order_rows
+from .loaders import with_order_relations, aload_orders
+from .metrics import timed
+from .models import MenuItem, Order
+from .paginations import MenuItemPagination, OrderCursorPagination, get_order_page_size
+from .renderers import ORJSONRenderer
+from .roles import DELIVERY_CREW, MANAGER, aget_user_roles
+from .serializers import OrderSerializer
+from .throttles import FifteenCallsPerMinute
+
+class AsyncAPIView(View):
+    """Read-only JSON view that runs natively on the ASGI application.
+
+    Mirrors what the DRF views in views.py do before reaching the handler:
+    cached token authentication, the IsAuthenticated check, throttling and the DRF
+    error format. Queries go through the async ORM, so a request waiting on
+    the database does not hold a worker thread.
+
+    The token, role and catalog caches are read and written with the async
+    cache API, and throttle stores that do I/O run in a worker thread, so
+    nothing here blocks the event loop.
+    """
+    http_method_names = ['get', 'head']
+    authentication_required = True
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+    renderer = ORJSONRenderer()
+
+    async def dispatch(self, request, *args, **kwargs):
+        request = Request(request)
+        handler = getattr(self, request.method.lower(), None) if request.method.lower() in self.http_method_names else None
+        try:
+            if handler is None:
+                raise exceptions.MethodNotAllowed(request.method)
+            with timed('auth'):
+                request.user = await self.authenticate(request)
+            if self.authentication_required and not request.user.is_authenticated:
+                raise exceptions.NotAuthenticated()
+            with timed('throttle'):
+                await self.check_throttles(request)
+            return await handler(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    async def authenticate(self, request):
+        forced_user = getattr(request._request, '_force_auth_user', None)
+        if forced_user is not None:
+            return forced_user
+
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != b'token':
+            return AnonymousUser()
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+        if len(auth) > 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain invalid characters.'))
+
+        user = await token_cache.aget(key)
+        if user is not None and user.is_active:
+            return user
+        try:
+            token = await Token.objects.select_related('user').aget(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        await token_cache.aset(key, token.user)
+        return token.user
+
+    async def check_throttles(self, request):
+        durations = []
+        for throttle in [throttle_class() for throttle_class in self.throttle_classes]:
+            if getattr(throttle, 'blocking', False):
+                allowed = await sync_to_async(throttle.allow_request)(request, self)
+            else:
+                allowed = throttle.allow_request(request, self)
+            if not allowed:
+                durations.append(throttle.wait())
+        if durations:
+            durations = [duration for duration in durations if duration is not None]
+            raise exceptions.Throttled(max(durations, default=None))
+
+    def handle_exception(self, exc):
+        response = exception_handler(exc, {'view': self})
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            response.status_code = status.HTTP_401_UNAUTHORIZED
+            response['WWW-Authenticate'] = 'Token'
+        return self.render(response.data, response.status_code, response.headers)
+
+    def render(self, data, status_code=status.HTTP_200_OK, headers=None):
+        response = HttpResponse(self.renderer.render(data), status=status_code, content_type='application/json')
+        for name, value in (headers or {}).items():
+            if name.lower() != 'content-type':
+                response[name] = value
+        return response
+
+# region Orders
+class AsyncOrderView(AsyncAPIView):
+    throttle_classes = (FifteenCallsPerMinute,)
+
+    async def get(self, request, *args, **kwargs):
+        roles = await aget_user_roles(request.user)
+        sources = order_sources(request.user, roles, request.query_params)
+        archive = len(sources) > 1
+        perpage = get_order_page_size(request.query_params)
+        ordering = request.query_params.get('ordering')
+
+        if 'cursor' in request.query_params:
+            paginator = OrderCursorPagination(page_size=perpage)
+            orders = await paginator.apaginate_querysets([order_rows.values(source) for source in sources], request, ordering=ordering)
+            return self.render(paginator.get_paginated_response_data(await aload_orders(orders, archive)))
+
+        # Same pages as the sync view's Paginator, minus its COUNT query: a
+        # page past the end is an empty slice either way.
+        try:
+            page = int(request.query_params.get('page', 1))
+        except ValueError:
+            raise exceptions.NotFound(_('Invalid page.'))
+        if page < 1:
+            return self.render([])
+        offset = (page - 1) * perpage
+        orders = [order async for order in order_source_rows(sources, ordering)[offset:offset + perpage]]
+        return self.render(await aload_orders(orders, archive))
+
+class AsyncSingleOrderView(AsyncAPIView):
+
+    async def get(self, request, pk, *args, **kwargs):
+        roles = await aget_user_roles(request.user)
+        # Orders moved by archive_orders are found in the archive
+        sources = order_detail_sources(request.user, roles)
+        if MANAGER in roles:
+            order, _ = await self.get_order([with_order_relations(source) for source in sources], pk)
+            return self.render(OrderSerializer(order).data)
+        elif DELIVERY_CREW in roles:
+            order, _ = await aorder_by_id([with_order_relations(source) for source in sources], pk)
+            return self.render(OrderSerializer([order] if order else [], many=True).data)
+        else:
+            order, archived = await self.get_order([order_rows.values(source) for source in sources], pk)
+            return self.render((await aload_orders([order], archived))[0])
+
+    async def get_order(self, sources, pk):
+        order, archived = await aorder_by_id(sources, pk)
+        if order is None:
+            raise exceptions.NotFound('No %s matches the given query.' % Order._meta.object_name)
+        return order, archived
+
+class OrderEventStreamView(AsyncAPIView):
+    """Server-sent events for the orders the user placed or delivers.
+
+    Pushes order.assigned when a manager assigns a delivery crew member and
+    order.delivered when the crew marks the order delivered. Clients that
+    reconnect with Last-Event-ID get the events they missed when the broker
+    keeps them.
+
+    Only served under ASGI: on a WSGI server each open stream would hold a
+    worker thread for its whole lifetime.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        if not isinstance(request._request, ASGIRequest):
+            return self.render({'message': 'Order event streams need the ASGI server (GUNICORN_ASGI=1)'}, status.HTTP_503_SERVICE_UNAVAILABLE)
+        try:
+            last_event_id = int(request.headers.get('Last-Event-ID', ''))
+        except ValueError:
+            last_event_id = None
+        subscription = await events.get_broker().subscribe(request.user.pk, last_event_id)
+        response = StreamingHttpResponse(self.stream(subscription), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream(self, subscription):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + events.ORDER_EVENTS_STREAM_TIMEOUT
+        try:
+            yield 'retry: 3000\n\n'
+            while (remaining := deadline - loop.time()) > 0:
+                event = await subscription.get(timeout=min(events.ORDER_EVENTS_HEARTBEAT, remaining))
+                yield events.format_event(event) if event else ': keep-alive\n\n'
+        finally:
+            subscription.close()
+
+# region MenuItem
+class AsyncMenuItemView(CatalogCacheMixin, AsyncAPIView):
+    authentication_required = False
+    throttle_classes = (FifteenCallsPerMinute,)
+    ordering_fields = ['price', 'title', 'featured', 'category']
+    pagination_class = MenuItemPagination
+
+    async def get(self, request, *args, **kwargs):
+        request.accepted_media_type = self.renderer.media_type
+        key = await self.aget_catalog_cache_key(request)
+        etag = get_etag(key)
+        if etag_matches(request, etag):
+            return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data = await cache.aget(key)
+        if data is None:
+            data = await self.list(request)
+            await cache.aset(key, data, CATALOG_CACHE_TIMEOUT)
+        response = self.render(data)
+        response['ETag'] = etag
+        return response
+
+    async def list(self, request):
+        filterset = MenuItemFilter(request.query_params, queryset=MenuItem.objects.all())
+        if 'search' in request.query_params:
+            # Search ranks candidates with a query of its own on some backends.
+            queryset = await sync_to_async(lambda: filterset.qs)()
+        else:
+            queryset = filterset.qs
+        queryset = OrderingFilter().filter_queryset(request, queryset, self)
+
+        paginator = self.pagination_class()
+        page_size = paginator.get_page_size(request)
+        django_paginator = paginator.django_paginator_class(menu_item_rows.values(queryset), page_size)
+        django_paginator.count = await queryset.acount()
+        page_number = paginator.get_page_number(request, django_paginator)
+        try:
+            paginator.page = django_paginator.page(page_number)
+        except InvalidPage as exc:
+            raise exceptions.NotFound(paginator.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        paginator.request = request
+
+        items = [item async for item in paginator.page.object_list]
+        return paginator.get_paginated_response(menu_item_rows.serialize(items)).data
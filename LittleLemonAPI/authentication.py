@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from .metrics import timed
+
+# Logout, deactivation and password changes delete the shared entry and the
+# local one of the process that made the change, so the timeouts only bound
+# how long other processes keep accepting a revoked token.
+TOKEN_CACHE_TIMEOUT = getattr(settings, 'TOKEN_CACHE_TIMEOUT', 60)
+TOKEN_CACHE_LOCAL_TIMEOUT = getattr(settings, 'TOKEN_CACHE_LOCAL_TIMEOUT', 5)
+TOKEN_CACHE_LOCAL_SIZE = getattr(settings, 'TOKEN_CACHE_LOCAL_SIZE', 10000)
+# All that is cached of a user. Any other field, the password hash among
+# them, is loaded from the database when something reads it, and save()
+# only writes the fields that were loaded.
+TOKEN_CACHE_USER_FIELDS = ('id', 'username', 'is_active')
+
+def _cache_key(key):
+    return f'token:{key}'
+
+def _user_from_values(values):
+    model = get_user_model()
+    return model.from_db(router.db_for_read(model), TOKEN_CACHE_USER_FIELDS, values)
+
+def _user_values(user):
+    return tuple(getattr(user, field) for field in TOKEN_CACHE_USER_FIELDS)
+
+class TokenCache:
+    """Token key -> a few of the user's fields, in a per-process LRU in front of the shared cache."""
+
+    def __init__(self, maxsize=TOKEN_CACHE_LOCAL_SIZE, timeout=TOKEN_CACHE_LOCAL_TIMEOUT):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.reset_stats()
+
+    def get(self, key):
+        values = self.get_local(key)
+        if values is None:
+            values = self.shared_result(key, cache.get(_cache_key(key)))
+        return None if values is None else _user_from_values(values)
+
+    async def aget(self, key):
+        """get() for async views: the shared cache is read without blocking the event loop."""
+        values = self.get_local(key)
+        if values is None:
+            values = self.shared_result(key, await cache.aget(_cache_key(key)))
+        return None if values is None else _user_from_values(values)
+
+    def set(self, key, user):
+        values = _user_values(user)
+        cache.set(_cache_key(key), values, TOKEN_CACHE_TIMEOUT)
+        self.set_local(key, values)
+
+    async def aset(self, key, user):
+        values = _user_values(user)
+        await cache.aset(_cache_key(key), values, TOKEN_CACHE_TIMEOUT)
+        self.set_local(key, values)
+
+    def get_local(self, key):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.entries.move_to_end(key)
+                self.local_hits += 1
+                return entry[0]
+        return None
+
+    def shared_result(self, key, values):
+        """Count a lookup in the shared cache and keep what it found locally."""
+        with self.lock:
+            if values is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+        self.set_local(key, values)
+        return values
+
+    def set_local(self, key, values):
+        if self.timeout <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (values, time.monotonic() + self.timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+        cache.delete_many([_cache_key(key) for key in keys])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def reset_stats(self):
+        self.local_hits = self.shared_hits = self.misses = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'local_hits': self.local_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'size': len(self.entries),
+            }
+
+token_cache = TokenCache()
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that skips the Token/User query on warm requests."""
+
+    @timed('auth')
+    def authenticate(self, request):
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        model = self.get_model()
+        user = token_cache.get(key)
+        if user is not None and user.is_active:
+            return (user, model(key=key, user=user))
+
+        try:
+            token = model.objects.select_related('user').get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        token_cache.set(key, token.user)
+        return (token.user, token)
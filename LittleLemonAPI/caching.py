@@ -0,0 +1,120 @@
+import hashlib
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+from .models import CatalogVersion
+
+# Cache backends that keep a separate copy in every process
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+def cache_is_shared():
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
+# A version in a per-process cache would only change in the worker that
+# handled the write, so without a shared cache it is read from the database,
+# one primary key lookup per request
+CATALOG_VERSION_IN_DATABASE = getattr(settings, 'CATALOG_VERSION_IN_DATABASE', not cache_is_shared())
+
+def _database_version():
+    # Seeded from the clock, like the cache counter below
+    return CatalogVersion.objects.get_or_create(pk=1, defaults={'version': time.time_ns()})[0].version
+
+def get_catalog_version():
+    if CATALOG_VERSION_IN_DATABASE:
+        return _database_version()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a restarted or evicted counter never goes
+        # back to a version that may still have responses cached.
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+async def aget_catalog_version():
+    """get_catalog_version() for async views, without blocking the event loop."""
+    if CATALOG_VERSION_IN_DATABASE:
+        return await sync_to_async(_database_version)()
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        await cache.aadd(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = await cache.aget(CATALOG_VERSION_KEY)
+    return version
+
+def bump_catalog_version():
+    if CATALOG_VERSION_IN_DATABASE:
+        # Writers call this once their transaction commits (transaction.on_commit)
+        if not CatalogVersion.objects.filter(pk=1).update(version=F('version') + 1):
+            _database_version()
+        return
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        return cache.get(CATALOG_VERSION_KEY)
+
+def get_etag(key):
+    return f'"{key.partition(":")[2]}"'
+
+def etag_matches(request, etag):
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    return etag in if_none_match or '*' in if_none_match
+
+class CatalogCacheMixin:
+    """Serve list and detail GETs of catalog views from a versioned cache.
+
+    Entries are keyed on the catalog version, so any Category or MenuItem
+    write makes every cached response unreachable instead of having to find
+    and delete them. The ETag is derived from the same key, which lets a
+    matching If-None-Match be answered without touching the cache or the
+    database.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    async def aget_catalog_cache_key(self, request):
+        return self.catalog_cache_key(await aget_catalog_version(), request)
+
+    def get_catalog_cache_key(self, request):
+        return self.catalog_cache_key(get_catalog_version(), request)
+
+    def catalog_cache_key(self, version, request):
+        query = sorted(request.query_params.lists())
+        parts = [
+            version,
+            self.__class__.__name__,
+            request.build_absolute_uri(request.path),
+            query,
+            request.accepted_media_type,
+        ]
+        return 'catalog:' + hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key = self.get_catalog_cache_key(request)
+        etag = get_etag(key)
+        if etag_matches(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        data = cache.get(key)
+        if data is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cache.set(key, response.data, CATALOG_CACHE_TIMEOUT)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        return response
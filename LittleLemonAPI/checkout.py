@@ -0,0 +1,36 @@
+from django.db import transaction
+from django.db.models import Sum
+from .models import Cart, OrderItem
+from .rollups import record_order
+
+class EmptyCart(Exception):
+    pass
+
+def checkout(user, save_order):
+    """Turn the user's cart into an order in a single transaction.
+
+    The cart rows are locked first, so a concurrent checkout for the same
+    user waits and then finds the cart already consumed. save_order is
+    called with the total and must return the saved Order.
+    """
+    with transaction.atomic():
+        carts = Cart.objects.filter(user=user)
+        lines = list(carts.select_for_update().values_list('id', 'menuitem_id', 'quantity', 'unit_price', 'price'))
+        if not lines:
+            raise EmptyCart
+        cart_ids = [line[0] for line in lines]
+        total = carts.filter(pk__in=cart_ids).aggregate(total=Sum('price'))['total']
+
+        order = save_order(total)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, menuitem_id=menuitem_id, quantity=quantity, unit_price=unit_price, price=price)
+            for _, menuitem_id, quantity, unit_price, price in lines
+        ])
+        # Backends without row locks (SQLite) fall back to checking that no
+        # other checkout deleted these lines in the meantime.
+        deleted, _ = Cart.objects.filter(pk__in=cart_ids).delete()
+        if deleted != len(cart_ids):
+            raise EmptyCart
+        # Queued in this transaction: the rollups count the order exactly when it is saved
+        record_order(order, [(menuitem_id, quantity, price) for _, menuitem_id, quantity, _, price in lines])
+    return order
@@ -0,0 +1,14 @@
+from django.core.checks import Tags, Warning, register
+from .caching import cache_is_shared
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if cache_is_shared():
+        return []
+    return [Warning(
+        'The default cache is private to each process.',
+        hint='Role, token and throttle state then differs between workers, and role changes reach the other '
+             'workers only after ROLE_CACHE_TIMEOUT. Set CACHE_BACKEND to a shared cache, such as Redis, '
+             'when running more than one worker.',
+        id='LittleLemonAPI.W001',
+    )]
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.db import connection, transaction
+from rest_framework import serializers
+from .events import ORDER_DELIVERED, publish_order_events
+from .models import Order
+from .rollups import record_deliveries
+
+# Most order ids one request can mark delivered
+ORDER_DELIVERY_BATCH_LIMIT = getattr(settings, 'ORDER_DELIVERY_BATCH_LIMIT', 500)
+
+DELIVERED = 'delivered'
+ALREADY_DELIVERED = 'already delivered'
+NOT_ASSIGNED = 'not assigned to you'
+
+class DeliverySerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=ORDER_DELIVERY_BATCH_LIMIT)
+
+def _deliver(crew_id, ids):
+    """Flip the undelivered orders among ids that are assigned to crew_id and return the ids flipped.
+
+    A single conditional UPDATE: the status check and the write happen
+    together, so when the same crew member delivers the same orders from
+    two devices at once, each order is flipped, and counted, by one of them.
+    """
+    if not connection.features.can_return_columns_from_insert:
+        # No UPDATE ... RETURNING: lock the rows to the same effect
+        flipped = list(Order.objects.select_for_update().filter(pk__in=ids, delivery_crew_id=crew_id, status=False).values_list('pk', flat=True))
+        Order.objects.filter(pk__in=flipped).update(status=True)
+        return set(flipped)
+    qn = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {qn(Order._meta.db_table)} SET {qn("status")} = %s '
+            f'WHERE {qn("id")} IN ({placeholders}) AND {qn("delivery_crew_id")} = %s AND {qn("status")} = %s '
+            f'RETURNING {qn("id")}',
+            [True, *ids, crew_id, False],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+def mark_delivered(crew, ids):
+    """Mark the caller's assigned orders among ids delivered and return each id's result, in the order given."""
+    ids = list(dict.fromkeys(ids))
+    with transaction.atomic():
+        flipped = _deliver(crew.pk, ids)
+        orders = {order.pk: order for order in Order.objects.filter(pk__in=ids).only('id', 'user_id', 'delivery_crew_id', 'status', 'date')}
+        delivered = [orders[pk] for pk in ids if pk in flipped]
+        if delivered:
+            record_deliveries(delivered)
+            publish_order_events(delivered, ORDER_DELIVERED)
+    results = []
+    for pk in ids:
+        order = orders.get(pk)
+        if pk in flipped:
+            result = DELIVERED
+        elif order is not None and order.delivery_crew_id == crew.pk and order.status:
+            result = ALREADY_DELIVERED
+        else:
+            # Orders of other crew members are not told apart from missing ones
+            result = NOT_ASSIGNED
+        results.append({'id': pk, 'result': result})
+    return results
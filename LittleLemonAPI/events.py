@@ -0,0 +1,225 @@
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import OrderEvent
+
+logger = logging.getLogger(__name__)
+
+ORDER_ASSIGNED = 'order.assigned'
+ORDER_DELIVERED = 'order.delivered'
+
+ORDER_EVENTS_POLL_INTERVAL = getattr(settings, 'ORDER_EVENTS_POLL_INTERVAL', 1)
+ORDER_EVENTS_RETENTION = getattr(settings, 'ORDER_EVENTS_RETENTION', 60 * 60)
+ORDER_EVENTS_QUEUE_SIZE = getattr(settings, 'ORDER_EVENTS_QUEUE_SIZE', 100)
+ORDER_EVENTS_HEARTBEAT = getattr(settings, 'ORDER_EVENTS_HEARTBEAT', 15)
+# Streams end after this long and the client reconnects, which spreads
+# long-lived connections across workers and bounds their lifetime.
+ORDER_EVENTS_STREAM_TIMEOUT = getattr(settings, 'ORDER_EVENTS_STREAM_TIMEOUT', 5 * 60)
+
+class Subscription:
+    """Queue of events for one open stream, fed from any thread."""
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=ORDER_EVENTS_QUEUE_SIZE)
+        self.last_id = 0
+        # Events held back while missed ones are loaded, see hold()
+        self.held = None
+
+    def deliver(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The stream's event loop is gone
+            self.close()
+
+    def hold(self):
+        """Keep new events back until release(), so they can be merged with missed ones."""
+        self.held = []
+
+    def release(self, missed):
+        held, self.held = self.held, None
+        for event in sorted(missed + held, key=lambda event: event['id']):
+            self._put(event)
+
+    def _put(self, event):
+        if self.held is not None:
+            self.held.append(event)
+            return
+        # An event both backfilled and polled is sent once
+        if event['id'] <= self.last_id:
+            return
+        self.last_id = event['id']
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client this far behind reconnects and resumes from its last event id
+            pass
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+class InProcessBroker:
+    """Pub/sub between the views and the streams open in this process.
+
+    Publishers may run in any thread, subscribers on any event loop. Events
+    published in another process are never seen, so this only suits a
+    single worker; see DatabaseBroker.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+        self.ids = itertools.count(1)
+
+    async def subscribe(self, user_id, last_event_id=None):
+        subscription = Subscription(self, user_id)
+        self.add(subscription)
+        return subscription
+
+    def add(self, subscription):
+        with self.lock:
+            self.subscriptions.setdefault(subscription.user_id, set()).add(subscription)
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.user_id, None)
+
+    def dispatch(self, user_id, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+    def publish(self, user_ids, event, data):
+        for user_id in user_ids:
+            self.dispatch(user_id, {'id': next(self.ids), 'event': event, 'data': data})
+
+    def publish_many(self, messages):
+        """Publish (user_ids, event, data) messages, in order."""
+        for user_ids, event, data in messages:
+            self.publish(user_ids, event, data)
+
+class DatabaseBroker(InProcessBroker):
+    """Broker shared by every worker through the OrderEvent table.
+
+    Publishing inserts one row per recipient. Each process runs a single
+    polling thread for all of its open streams, so the database sees one
+    indexed range query per interval however many clients are connected.
+    Row ids double as event ids, which lets a reconnecting client resume
+    from Last-Event-ID.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.poller = None
+        self.last_id = 0
+        self.last_prune = 0
+
+    async def subscribe(self, user_id, last_event_id=None):
+        last_id = None
+        if self.poller is None:
+            last_id = (await OrderEvent.objects.aaggregate(last_id=Max('id')))['last_id'] or 0
+        subscription = Subscription(self, user_id)
+        if last_event_id is not None:
+            subscription.hold()
+        self.add(subscription)
+        with self.lock:
+            if self.poller is None:
+                self.last_id = last_id if last_id is not None else self.last_id
+                self.poller = threading.Thread(target=self.poll, name='order-events', daemon=True)
+                self.poller.start()
+        if last_event_id is not None:
+            # Everything after the client's last event, some of which the
+            # poller may deliver too; the subscription drops the repeats
+            missed = OrderEvent.objects.filter(user_id=user_id, id__gt=last_event_id).order_by('id')
+            subscription.release([self.to_event(row) async for row in missed])
+        return subscription
+
+    def poll(self):
+        try:
+            while True:
+                with self.lock:
+                    if not self.subscriptions:
+                        self.poller = None
+                        return
+                try:
+                    for row in OrderEvent.objects.filter(id__gt=self.last_id).order_by('id'):
+                        self.dispatch(row.user_id, self.to_event(row))
+                        self.last_id = row.id
+                except DatabaseError:
+                    logger.exception('Polling order events failed')
+                    connection.close()
+                time.sleep(ORDER_EVENTS_POLL_INTERVAL)
+        finally:
+            connection.close()
+
+    def to_event(self, row):
+        return {'id': row.id, 'event': row.event, 'data': row.data}
+
+    def publish(self, user_ids, event, data):
+        self.publish_many([(user_ids, event, data)])
+
+    def publish_many(self, messages):
+        # One insert for every message, so bulk order changes cost the same
+        OrderEvent.objects.bulk_create([
+            OrderEvent(user_id=user_id, event=event, data=data)
+            for user_ids, event, data in messages
+            for user_id in user_ids
+        ])
+        if time.monotonic() - self.last_prune > ORDER_EVENTS_RETENTION / 10:
+            self.last_prune = time.monotonic()
+            OrderEvent.objects.filter(created__lt=timezone.now() - timedelta(seconds=ORDER_EVENTS_RETENTION)).delete()
+
+_broker = None
+_broker_lock = threading.Lock()
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.ORDER_EVENTS_BROKER)()
+        return _broker
+
+def order_event_message(order, event):
+    data = {
+        'id': order.pk,
+        'user_id': order.user_id,
+        'delivery_crew_id': order.delivery_crew_id,
+        'status': bool(order.status),
+    }
+    return sorted({order.user_id, order.delivery_crew_id} - {None}), event, data
+
+def publish_order_event(order, event):
+    """Tell the customer and the assigned delivery crew about an order change once it is committed."""
+    user_ids, event, data = order_event_message(order, event)
+    transaction.on_commit(lambda: get_broker().publish(user_ids, event, data))
+
+def publish_order_events(orders, event):
+    """publish_order_event() for many orders, handed to the broker together."""
+    messages = [order_event_message(order, event) for order in orders]
+    if messages:
+        transaction.on_commit(lambda: get_broker().publish_many(messages))
+
+def format_event(event):
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
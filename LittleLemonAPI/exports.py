@@ -0,0 +1,115 @@
+import csv
+import heapq
+import io
+import json
+from collections import defaultdict
+from django.conf import settings
+from django.db.models import F, Q
+from .models import ArchivedOrder, ArchivedOrderItem, OrderItem
+
+ORDER_EXPORT_CHUNK_SIZE = getattr(settings, 'ORDER_EXPORT_CHUNK_SIZE', 1000)
+
+ORDER_FIELDS = ('id', 'user_id', 'delivery_crew_id', 'status', 'total', 'date')
+ITEM_FIELDS = ('menuitem_id', 'title', 'quantity', 'unit_price', 'price')
+CSV_HEADER = ('order_id',) + ORDER_FIELDS[1:] + ITEM_FIELDS
+
+def iter_order_chunks(orders, chunk_size=ORDER_EXPORT_CHUNK_SIZE):
+    """Yield (order, items) pairs in (date, id) order, chunk_size orders per list.
+
+    Each chunk is a keyset query that resumes after the last order of the
+    previous one, plus one query for the chunk's items. Memory and the time
+    to the first chunk do not depend on how many orders match, and no cursor
+    or transaction stays open while a slow client reads.
+    """
+    orders = orders.order_by('date', 'id').values(*ORDER_FIELDS)
+    last = None
+    while True:
+        page = orders
+        if last is not None:
+            # date >= d first, so the index seeks to the resume point
+            page = page.filter(Q(date__gte=last['date']) & (Q(date__gt=last['date']) | Q(id__gt=last['id'])))
+        rows = list(page[:chunk_size])
+        if not rows:
+            return
+        items = defaultdict(list)
+        item_model = ArchivedOrderItem if orders.model is ArchivedOrder else OrderItem
+        lines = (
+            item_model.objects.filter(order_id__in=[row['id'] for row in rows])
+            .order_by('order_id', 'id')
+            .values('order_id', 'menuitem_id', 'quantity', 'unit_price', 'price', title=F('menuitem__title'))
+        )
+        for line in lines:
+            items[line.pop('order_id')].append(line)
+        yield [(row, items[row['id']]) for row in rows]
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1]
+
+def iter_merged_chunks(sources, chunk_size=ORDER_EXPORT_CHUNK_SIZE):
+    """iter_order_chunks() over several order querysets, such as hot and archived orders, merged in (date, id) order."""
+    if len(sources) == 1:
+        yield from iter_order_chunks(sources[0], chunk_size)
+        return
+    streams = [(pair for chunk in iter_order_chunks(source, chunk_size) for pair in chunk) for source in sources]
+    chunk = []
+    for pair in heapq.merge(*streams, key=lambda pair: (pair[0]['date'], pair[0]['id'])):
+        chunk.append(pair)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def order_data(order):
+    return {
+        'id': order['id'],
+        'user_id': order['user_id'],
+        'delivery_crew_id': order['delivery_crew_id'],
+        'status': bool(order['status']),
+        'total': str(order['total']),
+        'date': order['date'].isoformat(),
+    }
+
+def item_data(item):
+    return {
+        'menuitem_id': item['menuitem_id'],
+        'title': item['title'],
+        'quantity': item['quantity'],
+        'unit_price': str(item['unit_price']),
+        'price': str(item['price']),
+    }
+
+def csv_lines(chunks):
+    """One row per order item, with the order's columns repeated; orders without items get one row."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for chunk in chunks:
+        for order, items in chunk:
+            data = order_data(order)
+            data['status'] = 'true' if data['status'] else 'false'
+            for item in items or [None]:
+                writer.writerow([*data.values(), *(item_data(item).values() if item else [''] * len(ITEM_FIELDS))])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def ndjson_lines(chunks):
+    """One JSON object per order, with its items nested."""
+    for chunk in chunks:
+        yield ''.join(
+            json.dumps(dict(order_data(order), items=[item_data(item) for item in items])) + '\n'
+            for order, items in chunk
+        )
+
+EXPORT_FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+}
+
+def export_orders(sources, export_format, chunk_size=ORDER_EXPORT_CHUNK_SIZE):
+    """Stream the orders of every source queryset and their items as export_format text, one chunk at a time."""
+    write, _ = EXPORT_FORMATS[export_format]
+    return write(iter_merged_chunks(sources, chunk_size))
@@ -1,5 +1,11 @@
 import django_filters
+from datetime import datetime, timedelta
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
 from .models import MenuItem, Order
+from .roles import DELIVERY_CREW, MANAGER
+from .search import search_menu_items
 
 class MenuItemFilter(django_filters.FilterSet):
     title = django_filters.CharFilter(lookup_expr='icontains')
@@ -9,7 +15,109 @@ class MenuItemFilter(django_filters.FilterSet):
     featured = django_filters.BooleanFilter(field_name='featured', lookup_expr='exact')
     category_title = django_filters.CharFilter(field_name='category__title', lookup_expr='icontains')
     category_id = django_filters.NumberFilter(field_name='category__id', lookup_expr='exact')
+    search = django_filters.CharFilter(method='filter_search')
 
     class Meta:
         model = MenuItem
-        fields = ['title', 'min_price', 'max_price', 'featured', 'category_title', 'category_id']
\ No newline at end of file
+        fields = ['title', 'min_price', 'max_price', 'featured', 'category_title', 'category_id', 'search']
+
+    def filter_search(self, queryset, name, value):
+        return search_menu_items(queryset, value)
+
+def scope_orders(user, roles, model=Order):
+    """Orders visible to the user: all for managers, assigned ones for the delivery crew, own ones otherwise.
+
+    model may also be ArchivedOrder, which has the same fields.
+    """
+    if MANAGER in roles:
+        return model.objects.all()
+    if DELIVERY_CREW in roles:
+        return model.objects.filter(delivery_crew=user)
+    return model.objects.filter(user=user)
+
+# Each ordering with the tie-breakers that let an order index return rows
+# already sorted; see Order.Meta.indexes.
+ORDER_ORDERINGS = {
+    'date': ('date', 'id'),
+    'status': ('status', 'date', 'id'),
+    'id': ('id',),
+}
+ORDER_DEFAULT_ORDERING = 'date'
+
+def order_by(ordering):
+    """Expand an allowed ?ordering= value into its index-backed order_by() fields."""
+    descending = ordering.startswith('-')
+    return [f'-{field}' if descending else field for field in ORDER_ORDERINGS[ordering.lstrip('-')]]
+
+class OrderFilter(django_filters.FilterSet):
+    """Validated order list filters and orderings.
+
+    Only filters and orderings the order indexes can serve are accepted, so
+    callers cannot ask for a sort over the whole table.
+    """
+    date = django_filters.DateFilter(method='filter_day', input_formats=['%d-%m-%Y'])
+    start = django_filters.DateFilter(method='filter_start', input_formats=['%d-%m-%Y'])
+    end = django_filters.DateFilter(method='filter_end', input_formats=['%d-%m-%Y'])
+    status = django_filters.TypedChoiceFilter(
+        choices=[(str(value), value) for value in serializers.BooleanField.TRUE_VALUES | serializers.BooleanField.FALSE_VALUES],
+        coerce=lambda value: value in serializers.BooleanField.TRUE_VALUES,
+    )
+    ordering = django_filters.ChoiceFilter(
+        method='filter_ordering',
+        choices=[(prefix + name, prefix + name) for name in ORDER_ORDERINGS for prefix in ('', '-')],
+    )
+
+    error_messages = {
+        'date': 'Invalid date format. Use DD-MM-YYYY',
+        'start': 'Invalid date format. Use DD-MM-YYYY',
+        'end': 'Invalid date format. Use DD-MM-YYYY',
+        'status': 'Invalid value for status parameter',
+        'ordering': f'Orders can only be ordered by one of: {", ".join(ORDER_ORDERINGS)}',
+    }
+
+    class Meta:
+        model = Order
+        fields = ['date', 'start', 'end', 'status', 'ordering']
+
+    def filter_queryset(self, queryset):
+        return super().filter_queryset(queryset.order_by(*order_by(ORDER_DEFAULT_ORDERING)))
+
+    def day_start(self, day):
+        return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+    def filter_day(self, queryset, name, value):
+        # A half-open range on the column itself, which the indexes can seek
+        return queryset.filter(date__gte=self.day_start(value), date__lt=self.day_start(value + timedelta(days=1)))
+
+    def filter_start(self, queryset, name, value):
+        return queryset.filter(date__gte=self.day_start(value))
+
+    def filter_end(self, queryset, name, value):
+        return queryset.filter(date__lt=self.day_start(value + timedelta(days=1)))
+
+    def filter_ordering(self, queryset, name, value):
+        # Cursor pagination orders the page itself
+        if 'cursor' in self.data:
+            return queryset
+        return queryset.order_by(*order_by(value))
+
+def filter_orders(orders, query_params):
+    """Apply the order list's date, status and ordering query parameters."""
+    filterset = OrderFilter(query_params, queryset=orders)
+    if not filterset.is_valid():
+        raise ValidationError({'message': OrderFilter.error_messages[next(iter(filterset.errors))]})
+    return filterset.qs
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%d-%m-%Y').date()
+    except ValueError:
+        raise ValidationError({'message': 'Invalid date format. Use DD-MM-YYYY'})
+
+def report_range(query_params, days=30):
+    """The report's start and end days, the last `days` days by default."""
+    end = parse_date(query_params['end']) if query_params.get('end') else timezone.localdate()
+    start = parse_date(query_params['start']) if query_params.get('start') else end - timedelta(days=days - 1)
+    if start > end:
+        raise ValidationError({'message': 'start must not be after end'})
+    return start, end
@@ -0,0 +1,153 @@
+"""A job queue in the database, for work that can wait until after the response.
+
+enqueue() inserts a Job in the caller's transaction, so a job exists if and
+only if the write that asked for it was committed. Workers (`manage.py
+run_jobs`) claim due jobs in batches. On PostgreSQL the claim uses SELECT
+... FOR UPDATE SKIP LOCKED, so concurrent workers claim past each other's
+rows instead of waiting on them. SQLite has one writer at a time anyway,
+and there the claim is a conditional UPDATE. A claim is a lease of
+JOB_LEASE seconds: a job whose worker died comes due again.
+
+The jobs of a batch are handed to their kind's handler together, as a list
+of payloads, in one transaction that also deletes them, so a job's effects
+on the database and its completion commit together. When a batch fails,
+its jobs are run again one at a time to single out the failing ones. Those
+are retried with exponential backoff, and kept as failed after
+JOB_MAX_ATTEMPTS attempts. JOB_CONCURRENCY caps how many workers run jobs
+of a kind at once.
+"""
+import logging
+import traceback
+import uuid
+import zlib
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Kind: dotted path of the function that runs a batch, given its payloads
+JOB_HANDLERS = getattr(settings, 'JOB_HANDLERS', {
+    'rollups.apply': 'LittleLemonAPI.rollups.apply_rollup_jobs',
+})
+# Kind: most workers running jobs of that kind at once
+JOB_CONCURRENCY = getattr(settings, 'JOB_CONCURRENCY', {
+    # One worker adds every rollup change onto the shared daily rows, so
+    # batches never wait on each other's row locks
+    'rollups.apply': 1,
+})
+JOB_BATCH_SIZE = getattr(settings, 'JOB_BATCH_SIZE', 100)
+JOB_LEASE = getattr(settings, 'JOB_LEASE', 5 * 60)
+JOB_MAX_ATTEMPTS = getattr(settings, 'JOB_MAX_ATTEMPTS', 8)
+JOB_RETRY_DELAY = getattr(settings, 'JOB_RETRY_DELAY', 5)
+JOB_MAX_RETRY_DELAY = getattr(settings, 'JOB_MAX_RETRY_DELAY', 60 * 60)
+JOB_POLL_INTERVAL = getattr(settings, 'JOB_POLL_INTERVAL', 1)
+
+# Advisory lock that serialises the claims JOB_CONCURRENCY applies to, on PostgreSQL
+CLAIM_LOCK_ID = zlib.crc32(b'LittleLemonAPI.jobs')
+
+class LeaseLost(Exception):
+    """The claim on a job ran out and another worker took it over, or the job was removed."""
+
+def enqueue(kind, payload=None):
+    """Queue a job, committed with the current transaction if there is one."""
+    return Job.objects.create(kind=kind, payload={} if payload is None else payload)
+
+def _free_slots(now, kinds):
+    """How many more workers may start on each kind JOB_CONCURRENCY limits.
+
+    Also makes the calling transaction the only one counting until it
+    commits, so two workers cannot both take the last slot.
+    """
+    limited = {kind: limit for kind, limit in JOB_CONCURRENCY.items() if kinds is None or kind in kinds}
+    if not limited:
+        return {}
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [CLAIM_LOCK_ID])
+    else:
+        # A write up front makes this SQLite's one writer until it commits,
+        # like BEGIN IMMEDIATE, which Django 5.0 cannot ask for
+        Job.objects.filter(pk=0).update(locked_by='')
+    workers = dict(
+        Job.objects.filter(kind__in=limited, failed=False, run_after__gt=now).exclude(locked_by='')
+        .values('kind').annotate(workers=Count('locked_by', distinct=True)).values_list('kind', 'workers')
+    )
+    return {kind: limit - workers.get(kind, 0) for kind, limit in limited.items()}
+
+def claim_jobs(batch_size=JOB_BATCH_SIZE, kinds=None):
+    """Claim up to batch_size due jobs, the longest due first, and return them."""
+    token = uuid.uuid4().hex
+    now = timezone.now()
+    with transaction.atomic():
+        due = Job.objects.filter(failed=False, run_after__lte=now)
+        if kinds is not None:
+            due = due.filter(kind__in=kinds)
+        full = [kind for kind, slots in _free_slots(now, kinds).items() if slots <= 0]
+        if full:
+            due = due.exclude(kind__in=full)
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.order_by('run_after', 'id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return []
+        # Conditional, for the backends that could not lock the rows above
+        Job.objects.filter(pk__in=ids, failed=False, run_after__lte=now).update(
+            locked_by=token, run_after=now + timedelta(seconds=JOB_LEASE), attempts=F('attempts') + 1,
+        )
+    return list(Job.objects.filter(locked_by=token).order_by('id'))
+
+def _complete(kind, jobs):
+    with transaction.atomic():
+        import_string(JOB_HANDLERS[kind])([job.payload for job in jobs])
+        # Past its lease a job may be running elsewhere: keep its effects only while the claim holds
+        deleted, _ = Job.objects.filter(pk__in=[job.pk for job in jobs], locked_by=jobs[0].locked_by).delete()
+        if deleted != len(jobs):
+            raise LeaseLost
+
+def _retry(job, error):
+    changes = {'locked_by': '', 'last_error': error}
+    if job.attempts >= JOB_MAX_ATTEMPTS:
+        changes['failed'] = True
+    else:
+        delay = min(JOB_RETRY_DELAY * 2 ** (job.attempts - 1), JOB_MAX_RETRY_DELAY)
+        changes['run_after'] = timezone.now() + timedelta(seconds=delay)
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(**changes)
+
+def _run(kind, jobs):
+    """Run jobs of one kind together, or one at a time if that fails. Returns (done, failed)."""
+    try:
+        _complete(kind, jobs)
+        return len(jobs), 0
+    except LeaseLost:
+        if len(jobs) == 1:
+            return 0, 0
+    except Exception:
+        if len(jobs) == 1:
+            job = jobs[0]
+            logger.exception('Job %s (%s) failed, attempt %s of %s', job.pk, kind, job.attempts, JOB_MAX_ATTEMPTS)
+            _retry(job, traceback.format_exc())
+            return 0, 1
+    done = failed = 0
+    for job in jobs:
+        job_done, job_failed = _run(kind, [job])
+        done += job_done
+        failed += job_failed
+    return done, failed
+
+def run_jobs(batch_size=JOB_BATCH_SIZE, kinds=None):
+    """Claim one batch of due jobs and run it. Returns (claimed, done, failed)."""
+    jobs = claim_jobs(batch_size, kinds)
+    by_kind = {}
+    for job in jobs:
+        by_kind.setdefault(job.kind, []).append(job)
+    done = failed = 0
+    for kind, group in by_kind.items():
+        kind_done, kind_failed = _run(kind, group)
+        done += kind_done
+        failed += kind_failed
+    return len(jobs), done, failed
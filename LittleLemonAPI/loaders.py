@@ -0,0 +1,53 @@
+from collections import defaultdict
+from .fast_serializers import order_item_rows, order_rows
+from .metrics import timed
+from .models import ArchivedOrderItem, OrderItem
+
+def with_order_relations(queryset):
+    """Join the delivery crew user that OrderSerializer reads.
+
+    Order items are loaded separately, by load_orders, for all orders at once.
+    """
+    return queryset.select_related('delivery_crew')
+
+def order_items_queryset(order_ids, model=OrderItem):
+    return model.objects.filter(order_id__in=order_ids).order_by('id').values(*order_item_rows.keys, 'order_id')
+
+def order_items_querysets(order_ids, archive=False):
+    # Archived orders keep their ids, so an id is in one table or the other
+    models = (OrderItem, ArchivedOrderItem) if archive else (OrderItem,)
+    return [order_items_queryset(order_ids, model) for model in models]
+
+@timed('serialize')
+def attach_order_items(orders, items):
+    items_by_order = defaultdict(list)
+    to_representation = order_item_rows.to_representation
+    for item in items:
+        items_by_order[item['order_id']].append(to_representation(item))
+    data = order_rows.serialize(orders)
+    for order, order_data in zip(orders, data):
+        order_data['order_items'] = items_by_order[order['id']]
+    return data
+
+def load_orders(orders, archive=False):
+    """Serialize order_rows.values() rows with their items under order_items.
+
+    The same output as OrderSerializer plus OrderItemSerializer, built from
+    one query for the items of every order on the page and no model
+    instances. With archive, the rows may include archived orders, whose
+    items take a second query.
+    """
+    orders = list(orders)
+    items = []
+    if orders:
+        for queryset in order_items_querysets([order['id'] for order in orders], archive):
+            items += queryset
+    return attach_order_items(orders, items)
+
+async def aload_orders(orders, archive=False):
+    orders = list(orders)
+    items = []
+    if orders:
+        for queryset in order_items_querysets([order['id'] for order in orders], archive):
+            items += [item async for item in queryset]
+    return attach_order_items(orders, items)
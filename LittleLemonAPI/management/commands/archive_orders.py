@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from LittleLemonAPI.archive import ORDER_ARCHIVE_AFTER_DAYS, ORDER_ARCHIVE_BATCH_SIZE, archive_cutoff, archive_orders, vacuum_hot_tables
+
+class Command(BaseCommand):
+    help = 'Move delivered orders older than --days, and their items, to the archive tables, one batch per transaction.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=ORDER_ARCHIVE_AFTER_DAYS, help='Archive delivered orders older than this many days.')
+        parser.add_argument('--batch-size', type=int, default=ORDER_ARCHIVE_BATCH_SIZE, help='Orders moved per transaction.')
+
+    def handle(self, *args, **options):
+        if options['days'] < 0:
+            raise CommandError('--days must not be negative')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        before = archive_cutoff(options['days'])
+        archived = 0
+        # Safe to interrupt: every batch is committed on its own, and the next run resumes
+        for count in archive_orders(before, options['batch_size']):
+            archived += count
+            self.stdout.write(f'Archived {archived} orders')
+        if archived:
+            vacuum_hot_tables()
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} orders delivered before {before:%d-%m-%Y}'))
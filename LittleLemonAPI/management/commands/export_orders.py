@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from LittleLemonAPI.exports import EXPORT_FORMATS, ORDER_EXPORT_CHUNK_SIZE, export_orders
+from LittleLemonAPI.filters import filter_orders
+from LittleLemonAPI.models import ArchivedOrder, Order
+
+class Command(BaseCommand):
+    help = 'Write orders and their items as CSV or NDJSON, streamed in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--start', help='First day (DD-MM-YYYY).')
+        parser.add_argument('--end', help='Last day (DD-MM-YYYY).')
+        parser.add_argument('--status', help='Only delivered (true) or pending (false) orders.')
+        parser.add_argument('--output', help='File to write, defaults to stdout.')
+        parser.add_argument('--chunk-size', type=int, default=ORDER_EXPORT_CHUNK_SIZE, help='Orders read per query.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        params = {name: options[name] for name in ('start', 'end', 'status') if options[name]}
+        try:
+            sources = [filter_orders(model.objects.all(), params) for model in (Order, ArchivedOrder)]
+        except ValidationError as exc:
+            raise CommandError(exc.detail['message'])
+
+        chunks = export_orders(sources, options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
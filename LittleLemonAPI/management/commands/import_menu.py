@@ -0,0 +1,39 @@
+import csv
+import json
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from LittleLemonAPI.menu_import import MENU_IMPORT_BATCH_SIZE, import_menu, parse_csv
+
+class Command(BaseCommand):
+    help = 'Create or update menu items from a CSV or JSON file, all or nothing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV with a header row, or a JSON list of objects.')
+        parser.add_argument('--format', choices=['csv', 'json'], help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=MENU_IMPORT_BATCH_SIZE, help='Rows validated and written per batch.')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in ('csv', 'json'):
+            raise CommandError('Cannot tell the file format; pass --format csv or --format json')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        try:
+            text = path.read_text(encoding='utf-8')
+            rows = parse_csv(text) if file_format == 'csv' else json.loads(text)
+            ok, report = import_menu(rows, options['batch_size'])
+        except (OSError, ValueError, csv.Error) as exc:
+            raise CommandError(f'Cannot read {path}: {exc}')
+        except ValidationError as exc:
+            raise CommandError(exc.detail['message'])
+
+        if not ok:
+            for error in report['errors']:
+                for field, messages in error['errors'].items():
+                    self.stderr.write(f"Row {error['row']}: {field}: {' '.join(str(message) for message in messages)}")
+            raise CommandError(report['message'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report['created']} and updated {report['updated']} menu items, created {report['categories_created']} categories"
+        ))
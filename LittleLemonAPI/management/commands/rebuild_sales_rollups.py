@@ -0,0 +1,28 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from LittleLemonAPI.rollups import rebuild_rollups
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%d-%m-%Y').date()
+    except ValueError:
+        raise CommandError(f'Invalid date {value!r}. Use DD-MM-YYYY')
+
+class Command(BaseCommand):
+    help = 'Recompute the daily sales and delivery crew rollups from the orders, one batch of days at a time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_date, help='First day (DD-MM-YYYY), defaults to the oldest order.')
+        parser.add_argument('--end', type=parse_date, help='Last day (DD-MM-YYYY), defaults to the newest order.')
+        parser.add_argument('--batch-days', type=int, default=31, help='Days rebuilt per transaction.')
+
+    def handle(self, *args, **options):
+        if options['batch_days'] < 1:
+            raise CommandError('--batch-days must be at least 1')
+        if options['start'] and options['end'] and options['start'] > options['end']:
+            raise CommandError('--start must not be after --end')
+        batches = 0
+        for first, last in rebuild_rollups(options['start'], options['end'], options['batch_days']):
+            batches += 1
+            self.stdout.write(f'Rebuilt {first:%d-%m-%Y} to {last:%d-%m-%Y}')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {batches} batch(es)'))
@@ -0,0 +1,51 @@
+import logging
+import signal
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections, connection
+from LittleLemonAPI.jobs import JOB_BATCH_SIZE, JOB_POLL_INTERVAL, run_jobs
+
+logger = logging.getLogger('LittleLemonAPI.jobs')
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs, one batch at a time, until stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=JOB_BATCH_SIZE, help='Jobs claimed at a time.')
+        parser.add_argument('--kind', action='append', dest='kinds', help='Only run jobs of this kind. Repeat for more kinds.')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due instead of waiting for more.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        self.stopping = False
+        if not options['once']:
+            # Finish the batch in hand, then exit
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, self.stop)
+        done = failed = 0
+        while not self.stopping:
+            try:
+                claimed, batch_done, batch_failed = run_jobs(options['batch_size'], options['kinds'])
+            except DatabaseError:
+                if options['once']:
+                    raise
+                logger.exception('Running jobs failed')
+                connection.close()
+                time.sleep(JOB_POLL_INTERVAL)
+                continue
+            done += batch_done
+            failed += batch_failed
+            if claimed:
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'Ran {batch_done} jobs, {batch_failed} failed')
+                continue
+            if options['once']:
+                break
+            # Idle: drop a connection that is broken or past CONN_MAX_AGE, as a request would
+            close_old_connections()
+            time.sleep(JOB_POLL_INTERVAL)
+        self.stdout.write(self.style.SUCCESS(f'Ran {done} jobs, {failed} failed'))
+
+    def stop(self, signum, frame):
+        self.stopping = True
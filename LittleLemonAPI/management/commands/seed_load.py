@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from LittleLemonAPI.seeding import SEED_BATCH_SIZE, SEED_VOLUMES, LoadSeeder, seed_volumes
+
+class Command(BaseCommand):
+    help = 'Fill the database with realistic volumes of categories, menu items, users, carts and orders for load testing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1, help='Multiplies every default volume, e.g. 0.01 for a quick run.')
+        for name, volume in SEED_VOLUMES.items():
+            parser.add_argument(f'--{name.replace("_", "-")}', type=int, help=f'Defaults to {volume:,} times --scale.')
+        parser.add_argument('--days', type=int, default=365, help='Orders are spread over this many days up to now.')
+        parser.add_argument('--prefix', default='load', help='Prefix of the usernames and category slugs, so runs can be told apart.')
+        parser.add_argument('--password', default='password', help='Password of every seeded user.')
+        parser.add_argument('--batch-size', type=int, default=SEED_BATCH_SIZE, help='Rows per bulk insert and transaction.')
+        parser.add_argument('--seed', type=int, help='Random seed, for repeatable data.')
+
+    def handle(self, *args, **options):
+        volumes = seed_volumes(options['scale'], **{name: options[name] for name in SEED_VOLUMES})
+        if any(volume < 0 for volume in volumes.values()) or options['scale'] < 0:
+            raise CommandError('Volumes must not be negative')
+        if options['days'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--days and --batch-size must be at least 1')
+        seeder = LoadSeeder(
+            volumes, days=options['days'], prefix=options['prefix'], password=options['password'],
+            batch_size=options['batch_size'], seed=options['seed'],
+        )
+        if seeder.already_seeded():
+            raise CommandError(f'Users prefixed {options["prefix"]!r} already exist; pass another --prefix')
+        for what, count in seeder.run():
+            self.stdout.write(f'Created {count:,} {what}')
+        self.stdout.write(self.style.SUCCESS('Done'))
@@ -0,0 +1,31 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import OperationalError
+
+class Command(BaseCommand):
+    help = 'Block until the database accepts connections, with exponential backoff and a timeout.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait before giving up.')
+        parser.add_argument('--max-delay', type=float, default=5, help='Upper bound for the delay between attempts.')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        deadline = time.monotonic() + options['timeout']
+        delay = 0.1
+        while True:
+            try:
+                connection.ensure_connection()
+            except OperationalError as exc:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(f'Database unavailable after {options["timeout"]}s: {exc}')
+                self.stdout.write(f'Database unavailable, retrying in {delay:.1f}s')
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, options['max_delay'])
+            else:
+                connection.close()
+                self.stdout.write(self.style.SUCCESS('Database available'))
+                return
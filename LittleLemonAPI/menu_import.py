@@ -0,0 +1,166 @@
+import csv
+import io
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection, transaction
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from .caching import bump_catalog_version
+from .models import Category, MenuItem
+
+MENU_IMPORT_BATCH_SIZE = getattr(settings, 'MENU_IMPORT_BATCH_SIZE', 1000)
+
+class MenuItemImportSerializer(serializers.Serializer):
+    """One import row. Rows with an id update that item, others match an existing item by title."""
+    id = serializers.IntegerField(required=False, min_value=1)
+    title = serializers.CharField(max_length=255)
+    price = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal('0'))
+    featured = serializers.BooleanField(default=False)
+    category = serializers.SlugField(help_text='Category slug')
+    category_title = serializers.CharField(max_length=255, required=False, help_text='Creates the category when the slug is new')
+
+class CSVParser(BaseParser):
+    """A CSV body with a header row, parsed into a list of dicts."""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            return parse_csv(stream.read().decode(encoding))
+        except (UnicodeDecodeError, csv.Error) as exc:
+            raise ParseError(f'CSV parse error - {exc}')
+
+def parse_csv(text):
+    # Empty cells mean "not given", so optional columns can be left blank
+    return [{key: value for key, value in row.items() if value != ''} for row in csv.DictReader(io.StringIO(text))]
+
+class MenuImport:
+    """Validate and upsert menu item rows, batch by batch, all or nothing.
+
+    Every batch costs one query for its categories, one for the items it
+    may update, and one bulk insert and one bulk update. Nothing is written
+    unless every row is valid; the errors are reported per row instead.
+    """
+
+    def __init__(self, batch_size=MENU_IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.errors = []
+        self.created = self.updated = self.categories_created = 0
+        self.seen_titles = set()
+        self.seen_ids = set()
+        # One instance validates every row, as ListSerializer does, instead
+        # of building the fields again for each of them
+        self.serializer = MenuItemImportSerializer()
+
+    def run(self, rows):
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise serializers.ValidationError({'message': 'Expected a list of menu item objects'})
+        with transaction.atomic():
+            for start in range(0, len(rows), self.batch_size):
+                self.import_batch(rows[start:start + self.batch_size], start)
+            if self.errors:
+                transaction.set_rollback(True)
+                self.created = self.updated = self.categories_created = 0
+            else:
+                # bulk_create/bulk_update send no signals to invalidate the catalog cache
+                transaction.on_commit(bump_catalog_version)
+        return not self.errors
+
+    def report(self):
+        if self.errors:
+            return {'message': 'Import failed, nothing was saved', 'errors': self.errors}
+        return {'created': self.created, 'updated': self.updated, 'categories_created': self.categories_created}
+
+    def error(self, row_number, errors):
+        self.errors.append({'row': row_number, 'errors': errors})
+
+    def import_batch(self, rows, offset):
+        valid = []
+        for row_number, row in enumerate(rows, start=offset + 1):
+            try:
+                data = self.serializer.run_validation(row)
+            except serializers.ValidationError as exc:
+                self.error(row_number, exc.detail)
+                continue
+            key = data.get('id'), data['title']
+            if key[0] in self.seen_ids or (key[0] is None and key[1] in self.seen_titles):
+                self.error(row_number, {'title' if key[0] is None else 'id': ['Appears more than once in this import']})
+                continue
+            if key[0] is not None:
+                self.seen_ids.add(key[0])
+            self.seen_titles.add(key[1])
+            valid.append((row_number, data))
+
+        categories = self.resolve_categories(valid)
+        existing = self.find_items(valid)
+        to_create, to_update = [], []
+        for row_number, data in valid:
+            category = categories.get(data['category'])
+            if category is None:
+                self.error(row_number, {'category': ['Unknown category slug; give category_title to create it']})
+                continue
+            item = existing.get(('id', data['id']) if 'id' in data else ('title', data['title']))
+            if item is False:
+                self.error(row_number, {'title': ['More than one menu item has this title; give its id']})
+                continue
+            if item is None and 'id' in data:
+                self.error(row_number, {'id': ['No menu item with this id']})
+                continue
+            if item is None:
+                to_create.append(MenuItem(title=data['title'], price=data['price'], featured=data['featured'], category=category))
+            else:
+                item.title, item.price, item.featured, item.category = data['title'], data['price'], data['featured'], category
+                to_update.append(item)
+
+        if self.errors:
+            # Keep validating the rest of the import, but stop writing
+            return
+        MenuItem.objects.bulk_create(to_create)
+        fields = ['title', 'price', 'featured', 'category']
+        if connection.features.supports_update_conflicts_with_target:
+            # INSERT ... ON CONFLICT (id) DO UPDATE: one plain statement per
+            # batch, where bulk_update() builds a CASE per field and row
+            MenuItem.objects.bulk_create(to_update, update_conflicts=True, unique_fields=['id'], update_fields=fields)
+        else:
+            MenuItem.objects.bulk_update(to_update, fields)
+        self.created += len(to_create)
+        self.updated += len(to_update)
+
+    def resolve_categories(self, valid):
+        """Map the batch's category slugs to categories, creating new ones that have a title."""
+        slugs = {data['category'] for _, data in valid}
+        categories = {}
+        for category in Category.objects.filter(slug__in=slugs).order_by('-id'):
+            # The oldest category wins when slugs repeat
+            categories[category.slug] = category
+        new = {}
+        for _, data in valid:
+            if data['category'] not in categories and data.get('category_title'):
+                new.setdefault(data['category'], Category(slug=data['category'], title=data['category_title']))
+        if new and not self.errors:
+            Category.objects.bulk_create(new.values())
+            self.categories_created += len(new)
+        categories.update(new)
+        return categories
+
+    def find_items(self, valid):
+        """Existing items the batch refers to, keyed by ('id', id) or ('title', title); False when a title is ambiguous."""
+        ids = {data['id'] for _, data in valid if 'id' in data}
+        titles = {data['title'] for _, data in valid if 'id' not in data}
+        items = {}
+        if not ids and not titles:
+            return items
+        for item in MenuItem.objects.filter(pk__in=ids) | MenuItem.objects.filter(title__in=titles):
+            if item.pk in ids:
+                items[('id', item.pk)] = item
+            if item.title in titles:
+                key = ('title', item.title)
+                items[key] = False if key in items else item
+        return items
+
+def import_menu(rows, batch_size=MENU_IMPORT_BATCH_SIZE):
+    """Upsert the rows and return (ok, report)."""
+    menu_import = MenuImport(batch_size)
+    ok = menu_import.run(rows)
+    return ok, menu_import.report()
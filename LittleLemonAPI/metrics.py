@@ -0,0 +1,276 @@
+"""Per-request timings: Server-Timing headers, a slow request log and Prometheus histograms.
+
+RequestMetricsMiddleware puts a RequestMetrics in a context variable for
+the duration of each request. Every database connection gets an execute
+wrapper that adds each query's time to it, and timed() adds named phases:
+auth, roles, throttle, serialize and render. Phases are measured where
+they happen, so their time includes any queries they make. The context
+variable follows the request into sync_to_async threads, so the async
+views are measured the same way.
+
+Each response gets a Server-Timing header with durations and counts only.
+SQL text never goes into the header, since any client can read it; the
+slowest statement goes to the slow request log.
+
+Every process keeps its own histograms and copies them to the cache every
+METRICS_FLUSH_INTERVAL seconds. MetricsView adds up the copies of all the
+processes, so a scrape covers every worker when they share a cache
+(Redis, Memcached). With the default local-memory cache it only covers
+the process that answers.
+"""
+import bisect
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = getattr(settings, 'METRICS_ENABLED', True)
+METRICS_SLOW_REQUEST_MS = getattr(settings, 'METRICS_SLOW_REQUEST_MS', 500)
+METRICS_FLUSH_INTERVAL = getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Longest SQL kept for the slow request log
+SQL_LOG_LENGTH = 1000
+
+_current = ContextVar('request_metrics', default=None)
+
+class RequestMetrics:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.slowest_sql = None
+        self.slowest_time = 0.0
+        self.phases = {}
+        self.active = set()
+
+    def query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        if duration > self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_sql = sql
+
+    def server_timing(self, total):
+        entries = [f'total;dur={total * 1000:.1f}', f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"']
+        entries += [f'{phase};dur={duration * 1000:.1f}' for phase, duration in self.phases.items()]
+        if self.queries:
+            entries.append(f'db-slowest;dur={self.slowest_time * 1000:.1f}')
+        return ', '.join(entries)
+
+@contextmanager
+def timed(phase):
+    """Add the time spent in the block, or the decorated function, to the current request's phase."""
+    metrics = _current.get()
+    # Nested blocks of the same phase count once
+    if metrics is None or phase in metrics.active:
+        yield
+        return
+    metrics.active.add(phase)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.phases[phase] = metrics.phases.get(phase, 0.0) + time.perf_counter() - start
+        metrics.active.discard(phase)
+
+def record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.query(sql, time.perf_counter() - start)
+
+def instrument_connection(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+class MetricsRegistry:
+    """Request counts and histograms of this process, per route and method."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.durations = {}
+        self.db_durations = {}
+        self.queries = {}
+        self.last_flush = time.monotonic()
+
+    @property
+    def worker(self):
+        # Read at flush time, in case the registry was imported before a fork
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def observe(self, route, method, status, duration, db_duration, queries):
+        key = (route, method)
+        with self.lock:
+            status_key = (route, method, str(status))
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            for histograms, buckets, value in (
+                (self.durations, DURATION_BUCKETS, duration),
+                (self.db_durations, DURATION_BUCKETS, db_duration),
+                (self.queries, QUERY_BUCKETS, queries),
+            ):
+                histogram = histograms.get(key)
+                if histogram is None:
+                    histogram = histograms[key] = Histogram(buckets)
+                histogram.observe(value)
+            flush = time.monotonic() - self.last_flush >= METRICS_FLUSH_INTERVAL
+            if flush:
+                self.last_flush = time.monotonic()
+                snapshot = self.snapshot_locked()
+        if flush:
+            self.flush(snapshot)
+
+    def snapshot(self):
+        with self.lock:
+            return self.snapshot_locked()
+
+    def snapshot_locked(self):
+        def histograms(source):
+            return {key: (list(histogram.counts), histogram.sum) for key, histogram in source.items()}
+        return {
+            'requests': dict(self.requests),
+            'durations': histograms(self.durations),
+            'db_durations': histograms(self.db_durations),
+            'queries': histograms(self.queries),
+        }
+
+    def flush(self, snapshot):
+        """Publish this process's snapshot for MetricsView to add up with the others'."""
+        timeout = METRICS_FLUSH_INTERVAL * 6
+        cache.set(f'metrics:worker:{self.worker}', snapshot, timeout)
+        # A racy read-modify-write, but every worker re-adds itself on each flush
+        workers = cache.get('metrics:workers') or {}
+        now = time.time()
+        workers = {worker: seen for worker, seen in workers.items() if now - seen < timeout}
+        workers[self.worker] = now
+        cache.set('metrics:workers', workers, None)
+
+    def collect(self):
+        """This process's live metrics added to the last snapshot of every other one."""
+        me = self.worker
+        workers = [worker for worker in cache.get('metrics:workers') or {} if worker != me]
+        snapshots = list(cache.get_many([f'metrics:worker:{worker}' for worker in workers]).values())
+        snapshots.append(self.snapshot())
+        total = {'requests': {}, 'durations': {}, 'db_durations': {}, 'queries': {}}
+        for snapshot in snapshots:
+            for key, count in snapshot['requests'].items():
+                total['requests'][key] = total['requests'].get(key, 0) + count
+            for name in ('durations', 'db_durations', 'queries'):
+                for key, (counts, value_sum) in snapshot[name].items():
+                    previous_counts, previous_sum = total[name].get(key, ([0] * len(counts), 0))
+                    total[name][key] = ([a + b for a, b in zip(previous_counts, counts)], previous_sum + value_sum)
+        return total
+
+registry = MetricsRegistry()
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(route, method, **extra):
+    labels = {'route': route, 'method': method, **extra}
+    return '{' + ','.join(f'{name}="{_label(value)}"' for name, value in labels.items()) + '}'
+
+def prometheus_text(metrics):
+    """Render collected metrics in the Prometheus text exposition format."""
+    lines = [
+        '# HELP littlelemon_http_requests_total Requests by route, method and status code.',
+        '# TYPE littlelemon_http_requests_total counter',
+    ]
+    for (route, method, status), count in sorted(metrics['requests'].items()):
+        lines.append(f'littlelemon_http_requests_total{_labels(route, method, status=status)} {count}')
+    for name, source, buckets, description in (
+        ('littlelemon_http_request_duration_seconds', 'durations', DURATION_BUCKETS, 'Time to the response headers.'),
+        ('littlelemon_http_request_db_seconds', 'db_durations', DURATION_BUCKETS, 'Time spent in database queries.'),
+        ('littlelemon_http_request_queries', 'queries', QUERY_BUCKETS, 'Database queries per request.'),
+    ):
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+        for (route, method), (counts, value_sum) in sorted(metrics[source].items()):
+            cumulative = 0
+            for bound, count in zip([*buckets, '+Inf'], counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(route, method, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(route, method)} {float(value_sum)!r}')
+            lines.append(f'{name}_count{_labels(route, method)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+class RequestMetricsMiddleware:
+    """Measure every request; see the module docstring."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        total = time.perf_counter() - metrics.start
+        response['Server-Timing'] = metrics.server_timing(total)
+        match = getattr(request, 'resolver_match', None)
+        # Unmatched paths share one label, so scanners cannot add series
+        route = '/' + match.route if match else '<unmatched>'
+        registry.observe(route, request.method, response.status_code, total, metrics.db_time, metrics.queries)
+        if total * 1000 >= METRICS_SLOW_REQUEST_MS:
+            logger.warning('Slow request %s', json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'route': route,
+                'status': response.status_code,
+                'user_id': getattr(getattr(request, 'user', None), 'pk', None),
+                'duration_ms': round(total * 1000, 1),
+                'db_ms': round(metrics.db_time * 1000, 1),
+                'queries': metrics.queries,
+                'phases_ms': {phase: round(duration * 1000, 1) for phase, duration in metrics.phases.items()},
+                'slowest_query_ms': round(metrics.slowest_time * 1000, 1),
+                'slowest_query': (metrics.slowest_sql or '')[:SQL_LOG_LENGTH],
+            }))
+        return response
@@ -0,0 +1,88 @@
+from django.db import migrations
+
+# Search indexes are backend specific, so they are created with raw SQL
+# and skipped on databases that support neither variant.
+
+POSTGRES_FORWARD = [
+    # pg_trgm ships with Postgres but creating it needs a privileged role.
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    '''CREATE INDEX IF NOT EXISTS menuitem_title_tsv_idx ON "LittleLemonAPI_menuitem" USING gin (to_tsvector('simple', title))''',
+    'CREATE INDEX IF NOT EXISTS menuitem_title_trgm_idx ON "LittleLemonAPI_menuitem" USING gin (title gin_trgm_ops)',
+    '''CREATE INDEX IF NOT EXISTS category_title_tsv_idx ON "LittleLemonAPI_category" USING gin (to_tsvector('simple', title))''',
+    'CREATE INDEX IF NOT EXISTS category_title_trgm_idx ON "LittleLemonAPI_category" USING gin (title gin_trgm_ops)',
+]
+
+POSTGRES_REVERSE = [
+    'DROP INDEX IF EXISTS menuitem_title_tsv_idx',
+    'DROP INDEX IF EXISTS menuitem_title_trgm_idx',
+    'DROP INDEX IF EXISTS category_title_tsv_idx',
+    'DROP INDEX IF EXISTS category_title_trgm_idx',
+]
+
+# An FTS5 table with the trigram tokenizer (SQLite 3.34+) holds a copy of
+# each menu item's title and category title. Triggers keep it in sync with
+# every write, including bulk ones that skip model signals.
+SQLITE_FORWARD = [
+    '''CREATE VIRTUAL TABLE "LittleLemonAPI_menuitem_fts" USING fts5(title, category_title, tokenize='trigram')''',
+    '''INSERT INTO "LittleLemonAPI_menuitem_fts" (rowid, title, category_title)
+       SELECT m.id, m.title, c.title FROM "LittleLemonAPI_menuitem" m JOIN "LittleLemonAPI_category" c ON c.id = m.category_id''',
+    '''CREATE TRIGGER "LittleLemonAPI_menuitem_fts_insert" AFTER INSERT ON "LittleLemonAPI_menuitem" BEGIN
+         INSERT INTO "LittleLemonAPI_menuitem_fts" (rowid, title, category_title)
+         VALUES (new.id, new.title, (SELECT title FROM "LittleLemonAPI_category" WHERE id = new.category_id));
+       END''',
+    '''CREATE TRIGGER "LittleLemonAPI_menuitem_fts_update" AFTER UPDATE OF title, category_id ON "LittleLemonAPI_menuitem" BEGIN
+         UPDATE "LittleLemonAPI_menuitem_fts"
+         SET title = new.title, category_title = (SELECT title FROM "LittleLemonAPI_category" WHERE id = new.category_id)
+         WHERE rowid = new.id;
+       END''',
+    '''CREATE TRIGGER "LittleLemonAPI_menuitem_fts_delete" AFTER DELETE ON "LittleLemonAPI_menuitem" BEGIN
+         DELETE FROM "LittleLemonAPI_menuitem_fts" WHERE rowid = old.id;
+       END''',
+    '''CREATE TRIGGER "LittleLemonAPI_category_fts_update" AFTER UPDATE OF title ON "LittleLemonAPI_category" BEGIN
+         UPDATE "LittleLemonAPI_menuitem_fts" SET category_title = new.title
+         WHERE rowid IN (SELECT id FROM "LittleLemonAPI_menuitem" WHERE category_id = new.id);
+       END''',
+]
+
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS "LittleLemonAPI_category_fts_update"',
+    'DROP TRIGGER IF EXISTS "LittleLemonAPI_menuitem_fts_delete"',
+    'DROP TRIGGER IF EXISTS "LittleLemonAPI_menuitem_fts_update"',
+    'DROP TRIGGER IF EXISTS "LittleLemonAPI_menuitem_fts_insert"',
+    'DROP TABLE IF EXISTS "LittleLemonAPI_menuitem_fts"',
+]
+
+def sqlite_has_fts5_trigram(cursor):
+    try:
+        cursor.execute('''CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x, tokenize='trigram')''')
+    except Exception:
+        return False
+    cursor.execute('DROP TABLE temp.fts5_probe')
+    return True
+
+def run(statements):
+    def apply(apps, schema_editor):
+        connection = schema_editor.connection
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                selected = statements['postgresql']
+            elif connection.vendor == 'sqlite' and sqlite_has_fts5_trigram(cursor):
+                selected = statements['sqlite']
+            else:
+                return
+            for statement in selected:
+                cursor.execute(statement)
+    return apply
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0003_order_date_id_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run({'postgresql': POSTGRES_REVERSE, 'sqlite': SQLITE_REVERSE}),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.0.6 on 2026-10-18 21:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def partition_archived_orders(apps, schema_editor):
+    """On PostgreSQL, recreate the empty archive table range-partitioned on date.
+
+    Partitioned tables need the partition key in their primary key, so it
+    becomes (id, date). archive_orders adds a partition per month as it goes;
+    the default one only catches rows written some other way.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    model = apps.get_model('LittleLemonAPI', 'ArchivedOrder')
+    qn = schema_editor.quote_name
+    table = model._meta.db_table
+    users = qn(apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table)
+    schema_editor.execute(f'ALTER TABLE {qn(table)} RENAME TO {qn(table + "_unpartitioned")}')
+    schema_editor.execute(
+        f'CREATE TABLE {qn(table)} (LIKE {qn(table + "_unpartitioned")} INCLUDING DEFAULTS, PRIMARY KEY ("id", "date")) '
+        f'PARTITION BY RANGE ("date")'
+    )
+    schema_editor.execute(f'DROP TABLE {qn(table + "_unpartitioned")}')
+    for column in ('user_id', 'delivery_crew_id'):
+        schema_editor.execute(
+            f'ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(f"{table}_{column}_fk")} FOREIGN KEY ({qn(column)}) '
+            f'REFERENCES {users} ("id") DEFERRABLE INITIALLY DEFERRED'
+        )
+    schema_editor.execute(f'CREATE TABLE {qn(table + "_default")} PARTITION OF {qn(table)} DEFAULT')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LittleLemonAPI', '0008_order_composite_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('status', models.BooleanField(default=True)),
+                ('total', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('date', models.DateTimeField()),
+                ('delivery_crew', models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(partition_archived_orders, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.SmallIntegerField()),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('menuitem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='LittleLemonAPI.menuitem')),
+                ('order', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='LittleLemonAPI.archivedorder')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['date', 'id'], name='archived_order_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['user', 'date', 'id'], name='archived_order_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['delivery_crew', 'date', 'id'], name='archived_order_crew_date_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 
 # Create your models here.
 class Category(models.Model):
@@ -29,11 +31,23 @@ class Cart(models.Model):
         unique_together = ('user', 'menuitem')
 
 class Order(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name="delivery_crew", null=True)
-    status = models.BooleanField(db_index=True, default=0)
+    # The composite indexes below lead with every column that had its own
+    # index, so the single-column ones would only slow down writes.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name="delivery_crew", null=True, db_index=False)
+    status = models.BooleanField(default=0)
     total = models.DecimalField(max_digits=6, decimal_places=2)
-    date = models.DateTimeField(db_index=True, auto_now_add=True)
+    date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # One per role's order list: managers, by status or not, customers
+        # and delivery crew; each is filtered by equality and read in date order.
+        indexes = [
+            models.Index(fields=['date', 'id'], name='order_date_id_idx'),
+            models.Index(fields=['status', 'date', 'id'], name='order_status_date_idx'),
+            models.Index(fields=['user', 'date', 'id'], name='order_user_date_idx'),
+            models.Index(fields=['delivery_crew', 'status', 'date', 'id'], name='order_crew_status_date_idx'),
+        ]
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
@@ -43,4 +57,102 @@ class OrderItem(models.Model):
     price = models.DecimalField(max_digits=6, decimal_places=2)
 
     class Meta:
-        unique_together = ('order', 'menuitem')
\ No newline at end of file
+        unique_together = ('order', 'menuitem')
+
+# Delivered orders moved out of Order/OrderItem by the archive_orders
+# command, with their ids. Order lists read them only for date filters.
+class ArchivedOrder(models.Model):
+    # On PostgreSQL the table is partitioned by month of date, with
+    # (id, date) as its primary key; see migration 0009.
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+    delivery_crew = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='+', null=True, db_index=False)
+    status = models.BooleanField(default=True)
+    total = models.DecimalField(max_digits=6, decimal_places=2)
+    date = models.DateTimeField()
+
+    class Meta:
+        # Order's indexes, less the ones on status: every archived order is delivered
+        indexes = [
+            models.Index(fields=['date', 'id'], name='archived_order_date_idx'),
+            models.Index(fields=['user', 'date', 'id'], name='archived_order_user_date_idx'),
+            models.Index(fields=['delivery_crew', 'date', 'id'], name='archived_order_crew_date_idx'),
+        ]
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    # No foreign key constraint: PostgreSQL cannot reference the partitioned
+    # table by id alone
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, db_constraint=False)
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    quantity = models.SmallIntegerField()
+    unit_price = models.DecimalField(max_digits=6, decimal_places=2)
+    price = models.DecimalField(max_digits=6, decimal_places=2)
+
+class OrderEvent(models.Model):
+    """Order change waiting to be streamed to a user by the database broker."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    event = models.CharField(max_length=32)
+    data = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+class Job(models.Model):
+    """Background work queued by LittleLemonAPI.jobs and run by the run_jobs command."""
+    kind = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    # When the job is next due. A worker that claims a job pushes this to
+    # the end of its lease, so a job whose worker died comes due again.
+    run_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    # The claim that holds the job, empty while it waits
+    locked_by = models.CharField(max_length=32, blank=True)
+    failed = models.BooleanField(default=False)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_after', 'id'], condition=models.Q(failed=False), name='job_due_idx'),
+        ]
+
+class CatalogVersion(models.Model):
+    """The one row holding the catalog version when the cache is private to each process."""
+    version = models.BigIntegerField()
+
+class ThrottleCounter(models.Model):
+    """Requests made under a throttle key in one rate window."""
+    key = models.CharField(max_length=255)
+    period = models.BigIntegerField()
+    count = models.IntegerField(default=0)
+    # Unix time after which the counter is no longer read
+    expires = models.BigIntegerField(default=0, db_index=True)
+
+    class Meta:
+        unique_together = ('key', 'period')
+
+
+# Sales rollups, kept up to date by LittleLemonAPI.rollups and rebuilt from
+# Order/OrderItem by the rebuild_sales_rollups command.
+class DailySales(models.Model):
+    date = models.DateField(unique=True)
+    orders = models.IntegerField(default=0)
+    items = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+class DailyMenuItemSales(models.Model):
+    date = models.DateField()
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('date', 'menuitem')
+
+class DailyDeliveryCrewStats(models.Model):
+    date = models.DateField()
+    delivery_crew = models.ForeignKey(User, on_delete=models.CASCADE)
+    assigned = models.IntegerField(default=0)
+    delivered = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'delivery_crew')
@@ -1,7 +1,122 @@
+import base64
+import json
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
 
 class MenuItemPagination(PageNumberPagination):
     page_size = 3
     max_page_size = 5
     page_size_query_param = 'perpage'
-    page_query_param = 'page'
\ No newline at end of file
+    page_query_param = 'page'
+
+def get_order_page_size(query_params):
+    try:
+        perpage = int(query_params.get('perpage', 3))
+    except ValueError:
+        perpage = 0
+    if perpage < 1:
+        raise ValidationError({'message': 'perpage must be a positive integer'})
+    return min(perpage, 5)
+
+class OrderCursorPagination:
+    """Keyset pagination over (ordering field, id).
+
+    Each page is a range scan that starts right after the last row of the
+    previous page, so there is no COUNT and deep pages cost the same as the
+    first one. The ordering is fixed by the first page and carried in the
+    cursor.
+    """
+    cursor_query_param = 'cursor'
+    # Pages are keyed on (field, id), which only the (..., date, id) order
+    # indexes return presorted
+    ordering_fields = ('date',)
+    default_ordering = 'date'
+
+    def __init__(self, page_size):
+        self.page_size = page_size
+
+    def get_ordering(self, ordering):
+        ordering = ordering or self.default_ordering
+        if ordering.lstrip('-') not in self.ordering_fields:
+            raise ValidationError({'message': f'Cursor pagination can only order by one of: {", ".join(self.ordering_fields)}'})
+        return ordering
+
+    def encode_cursor(self, ordering, value, pk):
+        payload = json.dumps([ordering, value, pk]).encode()
+        return base64.urlsafe_b64encode(payload).decode()
+
+    def decode_cursor(self, cursor, model):
+        try:
+            ordering, value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(ordering, str):
+                raise ValueError(ordering)
+            ordering = self.get_ordering(ordering)
+            value = model._meta.get_field(ordering.lstrip('-')).to_python(value)
+            return ordering, value, int(pk)
+        except (TypeError, ValueError, DjangoValidationError):
+            raise NotFound('Invalid cursor')
+
+    def get_page_queryset(self, queryset, request, ordering=None):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            ordering, value, pk = self.decode_cursor(cursor, queryset.model)
+        else:
+            ordering, value, pk = self.get_ordering(ordering), None, None
+
+        field_name = ordering.lstrip('-')
+        descending = ordering.startswith('-')
+        self.ordering = ordering
+        self.field = queryset.model._meta.get_field(field_name)
+        self.request = request
+        if value is not None:
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{field_name}__{lookup}': value}) | Q(**{field_name: value, f'id__{lookup}': pk})
+            )
+        queryset = queryset.order_by(ordering, '-id' if descending else 'id')
+        return queryset[:self.page_size + 1]
+
+    def get_page(self, rows):
+        self.next_cursor = None
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            last = rows[-1]
+            if isinstance(last, dict):
+                # values() rows: value_to_string() wants an instance
+                last = self.field.model(pk=last['id'], **{self.field.attname: last[self.field.attname]})
+            self.next_cursor = self.encode_cursor(self.ordering, self.field.value_to_string(last), last.pk)
+        return rows
+
+    def paginate_queryset(self, queryset, request, ordering=None):
+        return self.get_page(list(self.get_page_queryset(queryset, request, ordering)))
+
+    async def apaginate_queryset(self, queryset, request, ordering=None):
+        return self.get_page([row async for row in self.get_page_queryset(queryset, request, ordering)])
+
+    def merge(self, pages):
+        """One page out of the pages of several querysets of values() rows, such as hot and archived orders."""
+        if len(pages) == 1:
+            return pages[0]
+        attname = self.field.attname
+        rows = sorted((row for page in pages for row in page), key=lambda row: (row[attname], row['id']), reverse=self.ordering.startswith('-'))
+        return rows[:self.page_size + 1]
+
+    def paginate_querysets(self, querysets, request, ordering=None):
+        return self.get_page(self.merge([list(self.get_page_queryset(queryset, request, ordering)) for queryset in querysets]))
+
+    async def apaginate_querysets(self, querysets, request, ordering=None):
+        return self.get_page(self.merge([
+            [row async for row in self.get_page_queryset(queryset, request, ordering)] for queryset in querysets
+        ]))
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response_data(self, data):
+        return {'next': self.get_next_link(), 'results': data}
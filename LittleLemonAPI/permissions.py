@@ -0,0 +1,14 @@
+from rest_framework.permissions import BasePermission
+from .roles import is_manager, is_delivery_crew
+
+class IsManager(BasePermission):
+    message = {'message': 'Only managers can access'}
+
+    def has_permission(self, request, view):
+        return is_manager(request)
+
+class IsDeliveryCrew(BasePermission):
+    message = {'message': 'Only delivery crew can access'}
+
+    def has_permission(self, request, view):
+        return is_delivery_crew(request)
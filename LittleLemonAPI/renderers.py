@@ -0,0 +1,76 @@
+"""orjson and MessagePack renderers and parsers.
+
+ORJSONRenderer writes the same bytes as DRF's JSONRenderer for everything
+our serializers return: decimals are already strings by then, datetimes
+get the same ISO 8601 form with a Z for UTC, and anything orjson cannot
+encode itself goes through DRF's own encoder. Indented output (the
+browsable API, `Accept: application/json; indent=4`) and the non-default
+COMPACT_JSON/UNICODE_JSON settings are left to JSONRenderer.
+
+MessagePack carries the same data as the JSON responses, so clients can
+switch with the Accept header alone.
+"""
+import msgpack
+import orjson
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+from .metrics import timed
+
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+# JSONEncoder.default() covers Decimal, lazy strings, querysets, generators...
+_encoder = encoders.JSONEncoder()
+
+def encode_default(obj):
+    return _encoder.default(obj)
+
+class ORJSONRenderer(JSONRenderer):
+
+    @timed('render')
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not self.compact or self.ensure_ascii or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=encode_default, option=ORJSON_OPTIONS)
+        # JSONRenderer escapes U+2028 and U+2029, which JavaScript does not
+        # allow in string literals
+        if b'\xe2\x80' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+class ORJSONParser(JSONParser):
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            # Like a strict JSONParser, orjson rejects NaN and Infinity
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    @timed('render')
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default)
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read())
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
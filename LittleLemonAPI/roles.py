@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.cache import cache
+from .metrics import timed
+
+MANAGER = 'Manager'
+DELIVERY_CREW = 'Delivery crew'
+
+# Memberships only change through the group endpoints and the admin, both of
+# which invalidate the entry, so the timeout only bounds staleness between
+# processes that do not share a cache: a demoted manager keeps the role in
+# other workers for that long. Run more than one worker with a shared cache
+# (the LittleLemonAPI.W001 deploy check warns otherwise).
+ROLE_CACHE_TIMEOUT = getattr(settings, 'ROLE_CACHE_TIMEOUT', 60)
+
+def _cache_key(user_id):
+    return f'roles:{user_id}'
+
+@timed('roles')
+def get_user_roles(user):
+    """Return the set of group names the user belongs to."""
+    if not user or not user.is_authenticated:
+        return frozenset()
+    key = _cache_key(user.pk)
+    roles = cache.get(key)
+    if roles is None:
+        roles = frozenset(user.groups.values_list('name', flat=True))
+        cache.set(key, roles, ROLE_CACHE_TIMEOUT)
+    return roles
+
+async def aget_user_roles(user):
+    """Async counterpart of get_user_roles() for the async views."""
+    if not user or not user.is_authenticated:
+        return frozenset()
+    with timed('roles'):
+        key = _cache_key(user.pk)
+        roles = await cache.aget(key)
+        if roles is None:
+            roles = frozenset([name async for name in user.groups.values_list('name', flat=True)])
+            await cache.aset(key, roles, ROLE_CACHE_TIMEOUT)
+    return roles
+
+def get_roles(request):
+    """Resolve the requesting user's groups once per request."""
+    roles = getattr(request, '_roles', None)
+    if roles is None:
+        roles = get_user_roles(request.user)
+        request._roles = roles
+    return roles
+
+def is_manager(request):
+    return MANAGER in get_roles(request)
+
+def is_delivery_crew(request):
+    return DELIVERY_CREW in get_roles(request)
+
+def invalidate_roles(*user_ids):
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
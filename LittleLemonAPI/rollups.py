@@ -0,0 +1,270 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .jobs import enqueue
+from .models import ArchivedOrder, ArchivedOrderItem, DailyDeliveryCrewStats, DailyMenuItemSales, DailySales, Job, MenuItem, Order, OrderItem
+
+ROLLUP_JOB = 'rollups.apply'
+
+# Rollup table, key fields and counted fields of each part of a rollup change
+ROLLUPS = {
+    'sales': (DailySales, ('date',), ('orders', 'items', 'revenue')),
+    'menu_items': (DailyMenuItemSales, ('date', 'menuitem_id'), ('quantity', 'revenue')),
+    'delivery_crew': (DailyDeliveryCrewStats, ('date', 'delivery_crew_id'), ('assigned', 'delivered')),
+}
+
+def _increment(model, keys, **deltas):
+    """Add deltas to the rollup row identified by keys, creating it if needed."""
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**keys).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **deltas)
+    except IntegrityError:
+        # Created by a concurrent writer in the meantime
+        model.objects.filter(**keys).update(**changes)
+
+def _add(model, key_fields, rows):
+    """Add every row's counts onto the rollup row with the same keys, creating missing ones.
+
+    One multi-row upsert on PostgreSQL and SQLite, so a rollup job costs the
+    same number of queries however many orders it counts.
+    """
+    if not rows:
+        return
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        for row in rows:
+            _increment(model, {field: row[field] for field in key_fields}, **{field: value for field, value in row.items() if field not in key_fields})
+        return
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    names = list(rows[0])
+    fields = [model._meta.get_field(name) for name in names]
+    columns = ', '.join(qn(field.column) for field in fields)
+    conflict = ', '.join(qn(model._meta.get_field(name).column) for name in key_fields)
+    updates = ', '.join(
+        f'{qn(field.column)} = {table}.{qn(field.column)} + EXCLUDED.{qn(field.column)}'
+        for name, field in zip(names, fields) if name not in key_fields
+    )
+    # SQLite caps the number of parameters per statement
+    batch_size = connection.ops.bulk_batch_size(fields, rows)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            values = ', '.join(['(' + ', '.join(['%s'] * len(fields)) + ')'] * len(batch))
+            params = [field.get_db_prep_save(row[name], connection) for row in batch for name, field in zip(names, fields)]
+            cursor.execute(f'INSERT INTO {table} ({columns}) VALUES {values} ON CONFLICT ({conflict}) DO UPDATE SET {updates}', params)
+
+class RollupChanges:
+    """Counts to add to (or, when negative, take off) the rollup rows, summed per row.
+
+    Every change is an addition, so changes can be applied in any order:
+    the queue may run a job for an order after one for its deletion and
+    still end up with the right counts.
+    """
+
+    def __init__(self):
+        self.rows = {name: {} for name in ROLLUPS}
+
+    def add(self, name, *key, **counts):
+        _, key_fields, count_fields = ROLLUPS[name]
+        row = self.rows[name].get(key)
+        if row is None:
+            row = self.rows[name][key] = {**dict(zip(key_fields, key)), **dict.fromkeys(count_fields, 0)}
+        for field, count in counts.items():
+            row[field] += count
+
+    def parts(self):
+        # Sorted keys keep concurrent writers from locking rows in opposite orders
+        return {name: [rows[key] for key in sorted(rows)] for name, rows in self.rows.items() if rows}
+
+    def apply(self):
+        for name, rows in self.parts().items():
+            model, key_fields, _ = ROLLUPS[name]
+            _add(model, key_fields, rows)
+
+    def queue(self):
+        """Have a run_jobs worker apply these changes once the current transaction commits."""
+        parts = self.parts()
+        if parts:
+            enqueue(ROLLUP_JOB, parts)
+
+def apply_rollup_jobs(payloads):
+    """Handler of ROLLUP_JOB: add up a batch of queued changes and apply them with one upsert per table.
+
+    Rows of menu items and delivery crew deleted since the change was queued
+    are dropped; deleting them removed their rollup rows too.
+    """
+    changes = RollupChanges()
+    for payload in payloads:
+        for name, rows in payload.items():
+            _, key_fields, count_fields = ROLLUPS[name]
+            for row in rows:
+                key = (date.fromisoformat(row['date']), *(row[field] for field in key_fields[1:]))
+                changes.add(name, *key, **{field: Decimal(str(row[field])) if field == 'revenue' else row[field] for field in count_fields})
+    menu_items = {key[1] for key in changes.rows['menu_items']}
+    if menu_items:
+        existing = set(MenuItem.objects.filter(pk__in=menu_items).values_list('pk', flat=True))
+        changes.rows['menu_items'] = {key: row for key, row in changes.rows['menu_items'].items() if key[1] in existing}
+    crew = {key[1] for key in changes.rows['delivery_crew']}
+    if crew:
+        existing = set(User.objects.filter(pk__in=crew).values_list('pk', flat=True))
+        changes.rows['delivery_crew'] = {key: row for key, row in changes.rows['delivery_crew'].items() if key[1] in existing}
+    changes.apply()
+
+def order_day(order):
+    return timezone.localdate(order.date)
+
+def _count_order(changes, order, lines, sign=1):
+    """Add an order, with its (menuitem_id, quantity, price) lines, to changes; sign=-1 takes it off."""
+    day = order_day(order)
+    changes.add('sales', day, orders=sign, items=sign * sum(line[1] for line in lines), revenue=sign * order.total)
+    for menuitem_id, quantity, price in lines:
+        changes.add('menu_items', day, menuitem_id, quantity=sign * quantity, revenue=sign * price)
+    if order.delivery_crew_id:
+        changes.add('delivery_crew', day, order.delivery_crew_id, assigned=sign, delivered=sign * int(order.status))
+
+def record_order(order, lines):
+    """Count a new order. lines are (menuitem_id, quantity, price) tuples."""
+    changes = RollupChanges()
+    _count_order(changes, order, lines)
+    changes.queue()
+
+def record_orders(orders):
+    """Count many new orders at once, as (order, lines) pairs like record_order() takes.
+
+    For bulk loads: the counts are applied right away, one upsert per rollup
+    table however many orders there are, rather than queued. Bulk-loaded
+    orders may already have a delivery crew and be delivered, so the crew
+    stats are counted as well.
+    """
+    changes = RollupChanges()
+    for order, lines in orders:
+        _count_order(changes, order, lines)
+    changes.apply()
+
+def unrecord_order(order):
+    """Take a deleted order back out of the rollups."""
+    lines = order.orderitem_set.values('menuitem_id').annotate(quantity=Sum('quantity'), revenue=Sum('price')).order_by('menuitem_id')
+    changes = RollupChanges()
+    _count_order(changes, order, [(line['menuitem_id'], line['quantity'], line['revenue']) for line in lines], sign=-1)
+    changes.queue()
+
+def _count_assignment(changes, order, previous_crew_id):
+    if previous_crew_id == order.delivery_crew_id:
+        return
+    day = order_day(order)
+    if previous_crew_id:
+        changes.add('delivery_crew', day, previous_crew_id, assigned=-1, delivered=-int(order.status))
+    if order.delivery_crew_id:
+        changes.add('delivery_crew', day, order.delivery_crew_id, assigned=1, delivered=int(order.status))
+
+def record_assignment(order, previous_crew_id):
+    record_assignments([(order, previous_crew_id)])
+
+def record_assignments(changes):
+    """record_assignment() for many (order, previous_crew_id) pairs, queued as one job."""
+    rollup = RollupChanges()
+    for order, previous_crew_id in changes:
+        _count_assignment(rollup, order, previous_crew_id)
+    rollup.queue()
+
+def record_delivery(order):
+    record_deliveries([order])
+
+def record_deliveries(orders):
+    """record_delivery() for many orders, queued as one job."""
+    changes = RollupChanges()
+    for order in orders:
+        changes.add('delivery_crew', order_day(order), order.delivery_crew_id, delivered=1)
+    changes.queue()
+
+def rebuild_rollups(start=None, end=None, batch_days=31):
+    """Recompute the rollups for [start, end] from Order/OrderItem, batch_days at a time.
+
+    Each batch replaces its days in one transaction, which also takes the
+    changes to those days out of the queued rollup jobs, since it counts them
+    from the orders. Yields the (first, last) day of every batch as it is
+    committed. Changes to orders made while a rebuild runs may be counted twice.
+    """
+    if start is None or end is None:
+        bounds = [model.objects.aggregate(first=Min('date'), last=Max('date')) for model in (Order, ArchivedOrder)]
+        firsts = [bound['first'] for bound in bounds if bound['first'] is not None]
+        if not firsts:
+            return
+        start = start or timezone.localdate(min(firsts))
+        end = end or timezone.localdate(max(bound['last'] for bound in bounds if bound['last'] is not None))
+
+    tzinfo = timezone.get_current_timezone()
+    first = start
+    while first <= end:
+        last = min(first + timedelta(days=batch_days - 1), end)
+        with transaction.atomic():
+            _drop_queued_changes(first, last)
+            _rebuild_days(first, last, tzinfo)
+        yield first, last
+        first = last + timedelta(days=1)
+
+def _drop_queued_changes(first, last):
+    """Remove the rows for days first..last from the queued rollup jobs, and the jobs left empty.
+
+    The jobs are locked first, so a worker applying one commits before the
+    days are counted again. A changed job loses its claim: the worker that
+    holds it read the old payload, and its completion is rolled back
+    (LeaseLost) rather than applied.
+    """
+    jobs = Job.objects.filter(kind=ROLLUP_JOB).only('payload')
+    if connection.features.has_select_for_update:
+        jobs = jobs.select_for_update()
+    emptied = []
+    for job in jobs:
+        payload = {}
+        for name, rows in job.payload.items():
+            rows = [row for row in rows if not first <= date.fromisoformat(row['date']) <= last]
+            if rows:
+                payload[name] = rows
+        if not payload:
+            emptied.append(job.pk)
+        elif payload != job.payload:
+            Job.objects.filter(pk=job.pk).update(payload=payload, locked_by='', run_after=timezone.now())
+    Job.objects.filter(pk__in=emptied).delete()
+
+def _rebuild_days(first, last, tzinfo):
+    for model in (DailySales, DailyMenuItemSales, DailyDeliveryCrewStats):
+        model.objects.filter(date__range=(first, last)).delete()
+
+    # Range on the indexed column, then group by local day
+    since = timezone.make_aware(datetime.combine(first, datetime.min.time()), tzinfo)
+    until = timezone.make_aware(datetime.combine(last + timedelta(days=1), datetime.min.time()), tzinfo)
+    sales, item_sales, crew_stats = {}, {}, {}
+    # Archived orders stay counted: add up the hot and the archive tables
+    for order_model, item_model in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+        orders = order_model.objects.filter(date__gte=since, date__lt=until).annotate(day=TruncDate('date', tzinfo=tzinfo))
+        items = item_model.objects.filter(order__date__gte=since, order__date__lt=until).annotate(day=TruncDate('order__date', tzinfo=tzinfo))
+        for row in orders.values('day').annotate(orders=Count('id'), revenue=Sum('total')).order_by():
+            _sum(sales, row['day'], orders=row['orders'], items=0, revenue=row['revenue'])
+        for row in items.values('day').annotate(items=Sum('quantity')).order_by():
+            _sum(sales, row['day'], items=row['items'])
+        for row in items.values('day', 'menuitem_id').annotate(quantity=Sum('quantity'), revenue=Sum('price')).order_by():
+            _sum(item_sales, (row['day'], row['menuitem_id']), quantity=row['quantity'], revenue=row['revenue'])
+        for row in (orders.filter(delivery_crew__isnull=False).values('day', 'delivery_crew_id')
+                    .annotate(assigned=Count('id'), delivered=Count('id', filter=Q(status=True))).order_by()):
+            _sum(crew_stats, (row['day'], row['delivery_crew_id']), assigned=row['assigned'], delivered=row['delivered'])
+
+    DailySales.objects.bulk_create(DailySales(date=day, **sales[day]) for day in sorted(sales))
+    DailyMenuItemSales.objects.bulk_create(
+        DailyMenuItemSales(date=day, menuitem_id=menuitem_id, **item_sales[day, menuitem_id]) for day, menuitem_id in sorted(item_sales)
+    )
+    DailyDeliveryCrewStats.objects.bulk_create(
+        DailyDeliveryCrewStats(date=day, delivery_crew_id=crew_id, **crew_stats[day, crew_id]) for day, crew_id in sorted(crew_stats)
+    )
+
+def _sum(totals, key, **values):
+    row = totals.setdefault(key, {})
+    for name, value in values.items():
+        row[name] = row.get(name, 0) + (value or 0)
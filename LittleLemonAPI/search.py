@@ -0,0 +1,106 @@
+import re
+from functools import lru_cache
+from django.db import connection
+from django.db.models import Case, F, FloatField, IntegerField, Q, When
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'LittleLemonAPI_menuitem_fts'
+# Same cut-off as pg_trgm's word_similarity_threshold, so both backends
+# tolerate the same typos.
+WORD_SIMILARITY_THRESHOLD = 0.6
+
+def search_words(term):
+    return re.findall(r'\w+', term.lower())
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def word_similarity(word, text):
+    """Best trigram overlap between word and any word of text (pg_trgm style)."""
+    query = trigrams(word)
+    return max((len(query & trigrams(other)) / len(query) for other in search_words(text)), default=0)
+
+def search_menu_items(queryset, term):
+    """Filter menu items matching term in their title or category title, best first.
+
+    Matches are prefix and typo tolerant. Postgres uses GIN full-text and
+    trigram indexes, SQLite an FTS5 trigram table; other databases fall back
+    to an unindexed substring match.
+    """
+    words = search_words(term)
+    if not words:
+        return queryset
+    if connection.vendor == 'postgresql':
+        return _search_postgres(queryset, ' '.join(words), words)
+    if connection.vendor == 'sqlite' and _has_fts_table(connection.settings_dict['NAME']):
+        return _search_sqlite(queryset, words)
+    return queryset.filter(Q(title__icontains=term) | Q(category__title__icontains=term))
+
+# region Postgres
+def _search_postgres(queryset, term, words):
+    # Each branch of the UNION is answered by its own index from
+    # 0004_menu_search; the expressions must stay identical to the indexed ones.
+    tsquery = "to_tsquery('simple', %s)"
+    prefix_query = ' & '.join(f'{word}:*' for word in words)
+    matching_ids = RawSQL(
+        f'''SELECT id FROM "LittleLemonAPI_menuitem" WHERE to_tsvector('simple', title) @@ {tsquery}
+            UNION SELECT id FROM "LittleLemonAPI_menuitem" WHERE %s <%% title
+            UNION SELECT id FROM "LittleLemonAPI_menuitem" WHERE category_id IN (
+                SELECT id FROM "LittleLemonAPI_category" WHERE to_tsvector('simple', title) @@ {tsquery}
+                UNION SELECT id FROM "LittleLemonAPI_category" WHERE %s <%% title
+            )''',
+        (prefix_query, term, prefix_query, term),
+    )
+    rank = RawSQL(
+        f'''ts_rank(to_tsvector('simple', "LittleLemonAPI_menuitem"."title"), {tsquery})
+            + word_similarity(%s, "LittleLemonAPI_menuitem"."title")''',
+        (prefix_query, term),
+        output_field=FloatField(),
+    )
+    return queryset.filter(pk__in=matching_ids).annotate(search_rank=rank).order_by(F('search_rank').desc(), 'id')
+
+# region SQLite
+@lru_cache(maxsize=None)
+def _has_fts_table(database_name):
+    return FTS_TABLE in connection.introspection.table_names()
+
+def _fts_expression(words):
+    # Any shared trigram makes a candidate; scoring below decides what matches,
+    # so every candidate is scored, however low bm25 would rank it.
+    # Words shorter than a trigram can only be found by a substring scan.
+    grams = {word[i:i + 3] for word in words for i in range(len(word) - 2)}
+    return ' OR '.join(f'"{gram}"' for gram in sorted(grams))
+
+def _search_sqlite(queryset, words):
+    expression = _fts_expression(words)
+    with connection.cursor() as cursor:
+        if expression:
+            cursor.execute(
+                f'SELECT rowid, title, category_title FROM "{FTS_TABLE}" WHERE "{FTS_TABLE}" MATCH %s',
+                [expression],
+            )
+        else:
+            cursor.execute(
+                f'SELECT rowid, title, category_title FROM "{FTS_TABLE}" WHERE title LIKE %s OR category_title LIKE %s',
+                [f'%{words[0]}%', f'%{words[0]}%'],
+            )
+        candidates = cursor.fetchall()
+
+    # As on Postgres, every word has to match the title, or every word the
+    # category title; title matches rank higher.
+    ranked = []
+    for pk, title, category_title in candidates:
+        ranks = []
+        for text, weight in ((title, 1), (category_title, 0.8)):
+            scores = [word_similarity(word, text) for word in words]
+            if all(score >= WORD_SIMILARITY_THRESHOLD for score in scores):
+                ranks.append(weight * sum(scores) / len(words))
+        if ranks:
+            ranked.append((-max(ranks), pk))
+    ranked.sort()
+    ids = [pk for _, pk in ranked]
+    if not ids:
+        return queryset.none()
+    position = Case(*(When(pk=pk, then=index) for index, pk in enumerate(ids)), output_field=IntegerField())
+    return queryset.filter(pk__in=ids).annotate(search_rank=position).order_by('search_rank')
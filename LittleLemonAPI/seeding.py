@@ -0,0 +1,207 @@
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.db import transaction
+from django.utils import timezone
+from .caching import bump_catalog_version
+from .models import Cart, Category, MenuItem, Order, OrderItem
+from .roles import DELIVERY_CREW, MANAGER
+from .rollups import record_orders
+
+# Volumes of a full seed_load run; --scale multiplies all of them
+SEED_VOLUMES = {
+    'categories': 2000,
+    'menu_items': 10000,
+    'users': 200000,
+    'managers': 20,
+    'delivery_crew': 1000,
+    'carts': 100000,
+    'orders': 300000,
+}
+SEED_BATCH_SIZE = 5000
+
+ADJECTIVES = ('Grilled', 'Roasted', 'Smoked', 'Crispy', 'Spicy', 'Lemon', 'Garlic', 'Herbed', 'Braised', 'Fresh', 'Sweet', 'Baked')
+DISHES = (
+    'Chicken', 'Salmon', 'Lamb', 'Risotto', 'Bruschetta', 'Greek Salad', 'Pasta', 'Falafel', 'Halloumi',
+    'Octopus', 'Moussaka', 'Gnocchi', 'Tiramisu', 'Baklava', 'Lemonade', 'Espresso', 'Flatbread', 'Soup',
+)
+CUISINES = ('Mediterranean', 'Greek', 'Italian', 'Turkish', 'Lebanese', 'Spanish', 'Moroccan', 'Seasonal')
+COURSES = ('Starters', 'Mains', 'Sides', 'Desserts', 'Drinks', 'Specials', 'Salads', 'Breakfast')
+
+@contextmanager
+def explicit_order_dates():
+    """Let bulk inserts set Order.date instead of auto_now_add stamping now()."""
+    field = Order._meta.get_field('date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+def batched(items, size):
+    items = iter(items)
+    while batch := list(islice(items, size)):
+        yield batch
+
+class LoadSeeder:
+    """Fill the database with realistic volumes of everything the API serves.
+
+    Everything goes in with bulk inserts, one transaction per batch, and
+    reuses a single password hash. Users are numbered under a prefix: the
+    first ones are managers, then delivery crew, then customers. Orders are
+    spread over the last `days` days in date order, so ids and dates grow
+    together as they do in production, and are counted in the sales rollups
+    as they go in.
+    """
+
+    def __init__(self, volumes, days=365, prefix='load', password='password', batch_size=SEED_BATCH_SIZE, seed=None):
+        self.volumes = volumes
+        self.days = days
+        self.prefix = prefix
+        self.password = password
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+
+    def already_seeded(self):
+        return User.objects.filter(username=self.username(0)).exists()
+
+    def username(self, number):
+        return f'{self.prefix}-user-{number}'
+
+    def run(self):
+        """Seed everything, yielding (what, count) as each part is committed."""
+        yield 'categories', self.seed_categories()
+        yield 'menu items', self.seed_menu_items()
+        yield 'users', self.seed_users()
+        yield 'group memberships', self.seed_groups()
+        yield 'cart lines', self.seed_carts()
+        orders = items = 0
+        for order_count, item_count in self.seed_orders():
+            orders += order_count
+            items += item_count
+        yield 'orders', orders
+        yield 'order items', items
+        bump_catalog_version()
+
+    def bulk_create(self, model, objs):
+        """Insert objs, which may be a generator, a batch at a time and return their pks."""
+        pks = []
+        for batch in batched(objs, self.batch_size):
+            with transaction.atomic():
+                pks += [obj.pk for obj in model.objects.bulk_create(batch)]
+        return pks
+
+    def price(self):
+        return Decimal(self.random.randrange(200, 4000, 25)) / 100
+
+    def seed_categories(self):
+        self.categories = self.bulk_create(Category, (
+            Category(
+                slug=f'{self.prefix}-category-{i}',
+                title=f'{self.random.choice(CUISINES)} {self.random.choice(COURSES)} {i}',
+            )
+            for i in range(self.volumes['categories'])
+        ))
+        return len(self.categories)
+
+    def seed_menu_items(self):
+        count = self.volumes['menu_items'] if self.categories else 0
+        prices = [self.price() for _ in range(count)]
+        pks = self.bulk_create(MenuItem, (
+            MenuItem(
+                title=f'{self.random.choice(ADJECTIVES)} {self.random.choice(DISHES)} {i}',
+                price=price,
+                featured=self.random.random() < 0.1,
+                category_id=self.random.choice(self.categories),
+            )
+            for i, price in enumerate(prices)
+        ))
+        self.menu_items = list(zip(pks, prices))
+        return count
+
+    def seed_users(self):
+        count = self.volumes['users']
+        password = make_password(self.password)
+        user_ids = self.bulk_create(User, (
+            User(username=self.username(i), email=f'{self.username(i)}@example.com', password=password)
+            for i in range(count)
+        ))
+        managers = self.volumes['managers']
+        self.managers = user_ids[:managers]
+        self.delivery_crew = user_ids[managers:managers + self.volumes['delivery_crew']]
+        self.customers = user_ids[managers + len(self.delivery_crew):]
+        return count
+
+    def seed_groups(self):
+        membership = User.groups.through
+        manager = Group.objects.get_or_create(name=MANAGER)[0]
+        crew = Group.objects.get_or_create(name=DELIVERY_CREW)[0]
+        memberships = [membership(user_id=user_id, group_id=manager.pk) for user_id in self.managers]
+        memberships += [membership(user_id=user_id, group_id=crew.pk) for user_id in self.delivery_crew]
+        return len(self.bulk_create(membership, memberships))
+
+    def lines(self, most):
+        """Distinct (menuitem_id, quantity, unit_price) lines for one cart or order."""
+        count = min(self.random.randint(1, most), len(self.menu_items))
+        return [(pk, self.random.randint(1, 3), price) for pk, price in self.random.sample(self.menu_items, count)]
+
+    def seed_carts(self):
+        carts = []
+        if self.menu_items and self.customers:
+            for user_id in self.random.sample(self.customers, min(len(self.customers), self.volumes['carts'])):
+                carts += [
+                    Cart(user_id=user_id, menuitem_id=pk, quantity=quantity, unit_price=price, price=price * quantity)
+                    for pk, quantity, price in self.lines(4)
+                ]
+                if len(carts) >= self.volumes['carts']:
+                    break
+        return len(self.bulk_create(Cart, carts[:self.volumes['carts']]))
+
+    def seed_orders(self):
+        """Insert orders and their items batch by batch, yielding how many of each."""
+        count = self.volumes['orders']
+        if not count or not self.menu_items or not self.customers:
+            return
+        now = timezone.now()
+        start = now - timedelta(days=self.days)
+        span = (now - start) / count
+        with explicit_order_dates():
+            for first in range(0, count, self.batch_size):
+                size = min(self.batch_size, count - first)
+                # Random times within this batch's slice of the range, in order
+                dates = sorted(start + span * (first + self.random.random() * size) for _ in range(size))
+                orders, order_lines = [], []
+                for date in dates:
+                    lines = self.lines(5)
+                    # Customers order at very different rates
+                    user_id = self.customers[int(len(self.customers) * self.random.random() ** 3)]
+                    crew_id = self.random.choice(self.delivery_crew) if self.delivery_crew and self.random.random() < 0.9 else None
+                    delivered = crew_id is not None and now - date > timedelta(hours=2) and self.random.random() < 0.95
+                    orders.append(Order(
+                        user_id=user_id, delivery_crew_id=crew_id, status=delivered, date=date,
+                        total=sum(price * quantity for _, quantity, price in lines),
+                    ))
+                    order_lines.append(lines)
+                with transaction.atomic():
+                    Order.objects.bulk_create(orders)
+                    items = [
+                        OrderItem(order_id=order.pk, menuitem_id=pk, quantity=quantity, unit_price=price, price=price * quantity)
+                        for order, lines in zip(orders, order_lines)
+                        for pk, quantity, price in lines
+                    ]
+                    OrderItem.objects.bulk_create(items, batch_size=self.batch_size)
+                    record_orders([
+                        (order, [(pk, quantity, price * quantity) for pk, quantity, price in lines])
+                        for order, lines in zip(orders, order_lines)
+                    ])
+                yield len(orders), len(items)
+
+def seed_volumes(scale=1, **overrides):
+    """SEED_VOLUMES times scale, but at least one of each, with any volume given explicitly taken as is."""
+    volumes = {name: max(round(volume * scale), 1 if scale > 0 else 0) for name, volume in SEED_VOLUMES.items()}
+    volumes.update({name: value for name, value in overrides.items() if value is not None})
+    return volumes
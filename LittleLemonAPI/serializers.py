@@ -72,4 +72,29 @@ class OrderItemSerializer(serializers.ModelSerializer):
 class GroupSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ('id', 'username', 'email')
\ No newline at end of file
+        fields = ('id', 'username', 'email')
+
+class DailySalesSerializer(serializers.ModelSerializer):
+    date = serializers.DateField(format='%d-%m-%Y')
+
+    class Meta:
+        model = DailySales
+        fields = ('date', 'orders', 'items', 'revenue')
+
+class MenuItemSalesSerializer(serializers.Serializer):
+    menuitem_id = serializers.IntegerField()
+    title = serializers.CharField()
+    quantity = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class CategorySalesSerializer(serializers.Serializer):
+    category_id = serializers.IntegerField()
+    title = serializers.CharField()
+    quantity = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+class DeliveryCrewStatsSerializer(serializers.Serializer):
+    delivery_crew_id = serializers.IntegerField()
+    username = serializers.CharField()
+    assigned = serializers.IntegerField()
+    delivered = serializers.IntegerField()
@@ -0,0 +1,55 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from .authentication import token_cache
+from .caching import bump_catalog_version
+from .metrics import METRICS_ENABLED, instrument_connection
+from .models import Category, MenuItem, Order
+from .roles import invalidate_roles
+from .rollups import unrecord_order
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_group_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # group.user_set.clear() does not report which users were removed
+        invalidate_roles(*instance.user_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if reverse:
+            invalidate_roles(*(pk_set or ()))
+        else:
+            invalidate_roles(instance.pk)
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=MenuItem)
+@receiver(post_delete, sender=MenuItem)
+def invalidate_catalog(sender, **kwargs):
+    # Once the write is visible, or a request could cache the old rows under the new version
+    transaction.on_commit(bump_catalog_version)
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    # Covers djoser's token/logout, which deletes the user's tokens
+    token_cache.invalidate(instance.key)
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, update_fields=None, **kwargs):
+    # Logging in only touches last_login, which nothing reads from request.user
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    keys = list(Token.objects.filter(user=instance).values_list('key', flat=True))
+    if keys:
+        token_cache.invalidate(*keys)
+
+@receiver(pre_delete, sender=Order)
+def remove_order_from_rollups(sender, instance, **kwargs):
+    # Before the cascade removes the order items it is counted by
+    unrecord_order(instance)
+
+@receiver(connection_created)
+def instrument_database_connection(sender, connection, **kwargs):
+    if METRICS_ENABLED:
+        instrument_connection(connection)
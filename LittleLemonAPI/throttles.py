@@ -1,4 +1,210 @@
-from rest_framework.throttling import UserRateThrottle
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+from django.utils.module_loading import import_string
+from rest_framework import throttling
+from .caching import cache_is_shared
+from .metrics import timed
+from .models import ThrottleCounter
+
+class ThrottleStore:
+    """Per-key request counters, one per rate window."""
+    # Whether calls do blocking I/O that async views must run in a thread
+    blocking = False
+
+    def hit(self, key, period, timeout):
+        """Count a request in `period` and return it with the previous period's count."""
+        return self.incr(key, period, timeout), self.get(key, period - 1)
+
+class MemoryThrottleStore(ThrottleStore):
+    """Counters in a dict; exact within one process only. Meant for tests."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+
+    def incr(self, key, period, timeout):
+        with self.lock:
+            count = self.counters.get((key, period), 0) + 1
+            self.counters[(key, period)] = count
+            # Only the current and the previous window are ever read
+            self.counters.pop((key, period - 2), None)
+            return count
+
+    def decr(self, key, period):
+        with self.lock:
+            self.counters[(key, period)] = self.counters.get((key, period), 1) - 1
+
+    def get(self, key, period):
+        with self.lock:
+            return self.counters.get((key, period), 0)
+
+class CacheThrottleStore(ThrottleStore):
+    """Counters in the default cache, using its atomic incr.
+
+    Shared by every worker when the cache is shared (Redis, Memcached), per
+    process with the default local-memory cache.
+    """
+
+    @property
+    def blocking(self):
+        # A shared cache is a network round trip
+        return cache_is_shared()
+
+    def _key(self, key, period):
+        return f'{key}:{period}'
+
+    def incr(self, key, period, timeout):
+        cache_key = self._key(key, period)
+        cache.add(cache_key, 0, timeout)
+        try:
+            return cache.incr(cache_key)
+        except ValueError:
+            # Expired between add() and incr()
+            cache.add(cache_key, 1, timeout)
+            return 1
+
+    def decr(self, key, period):
+        try:
+            cache.decr(self._key(key, period))
+        except ValueError:
+            pass
+
+    def get(self, key, period):
+        return cache.get(self._key(key, period), 0)
+
+class DatabaseThrottleStore(ThrottleStore):
+    """Counters in the ThrottleCounter table, shared by every worker.
+
+    Each request is a single upsert that returns the new count, so there is
+    no read-modify-write race between processes. Every counter stores when
+    it stops being read, which depends on its throttle's rate, and counters
+    past that are pruned every few seconds.
+    """
+    blocking = True
+    prune_interval = 10
+
+    def __init__(self):
+        self.last_prune = 0
+
+    def hit(self, key, period, timeout):
+        if connection.vendor != 'postgresql':
+            return super().hit(key, period, timeout)
+        # Increment and read the previous window in one round trip
+        self.prune()
+        table = connection.ops.quote_name(ThrottleCounter._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'WITH current AS ({self.upsert_sql(table)}) '
+                f'SELECT (SELECT "count" FROM current), '
+                f'(SELECT "count" FROM {table} WHERE "key" = %s AND "period" = %s)',
+                [key, period, self.expires(timeout), key, period - 1],
+            )
+            current, previous = cursor.fetchone()
+        return current, previous or 0
+
+    def incr(self, key, period, timeout):
+        self.prune()
+        if connection.vendor in ('postgresql', 'sqlite'):
+            table = connection.ops.quote_name(ThrottleCounter._meta.db_table)
+            with connection.cursor() as cursor:
+                cursor.execute(self.upsert_sql(table), [key, period, self.expires(timeout)])
+                return cursor.fetchone()[0]
+        counter, created = ThrottleCounter.objects.get_or_create(
+            key=key, period=period, defaults={'count': 1, 'expires': self.expires(timeout)},
+        )
+        if created:
+            return 1
+        ThrottleCounter.objects.filter(pk=counter.pk).update(count=F('count') + 1)
+        return ThrottleCounter.objects.values_list('count', flat=True).get(pk=counter.pk)
+
+    def upsert_sql(self, table):
+        return (
+            f'INSERT INTO {table} ("key", "period", "count", "expires") VALUES (%s, %s, 1, %s) '
+            f'ON CONFLICT ("key", "period") DO UPDATE SET "count" = {table}."count" + 1 '
+            f'RETURNING "count"'
+        )
+
+    def decr(self, key, period):
+        ThrottleCounter.objects.filter(key=key, period=period).update(count=F('count') - 1)
+
+    def get(self, key, period):
+        return ThrottleCounter.objects.filter(key=key, period=period).values_list('count', flat=True).first() or 0
+
+    def expires(self, timeout):
+        # The counter of a window is read until the next window ends, at most timeout seconds from now
+        return int(time.time()) + timeout
+
+    def prune(self):
+        if time.monotonic() - self.last_prune < self.prune_interval:
+            return
+        self.last_prune = time.monotonic()
+        ThrottleCounter.objects.filter(expires__lt=int(time.time())).delete()
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_throttle_store():
+    path = getattr(settings, 'THROTTLE_STORE', 'LittleLemonAPI.throttles.CacheThrottleStore')
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = import_string(path)()
+        return _stores[path]
+
+class SlidingWindowThrottleMixin:
+    """Sliding-window rate limit kept in two counters per key.
+
+    The count for the last `duration` seconds is estimated from the current
+    fixed window plus the previous one, weighted by how much of it still
+    overlaps. That is constant memory per key and one atomic increment per
+    request, instead of a timestamp list that is re-pickled on every call.
+    Rejected requests are not counted.
+    """
+
+    @property
+    def store(self):
+        return get_throttle_store()
+
+    @property
+    def blocking(self):
+        return self.store.blocking
+
+    @timed('throttle')
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        store = self.store
+        self.now = self.timer()
+        self.period, elapsed = divmod(self.now, self.duration)
+        self.period = int(self.period)
+        self.weight = 1 - elapsed / self.duration
+        self.current, self.previous = store.hit(self.key, self.period, self.duration * 2)
+        if self.previous * self.weight + self.current > self.num_requests:
+            store.decr(self.key, self.period)
+            self.current -= 1
+            return self.throttle_failure()
+        return True
+
+    def wait(self):
+        window_left = (self.period + 1) * self.duration - self.now
+        if self.current >= self.num_requests or not self.previous:
+            return window_left
+        # Until the previous window's share leaves room for one more request
+        weight = (self.num_requests - self.current - 1) / self.previous
+        return max(0.0, (1 - weight) * self.duration - (self.duration - window_left))
+
+class AnonRateThrottle(SlidingWindowThrottleMixin, throttling.AnonRateThrottle):
+    pass
+
+class UserRateThrottle(SlidingWindowThrottleMixin, throttling.UserRateThrottle):
+    pass
 
 class FifteenCallsPerMinute(UserRateThrottle):
-    scope = 'fifteen'
\ No newline at end of file
+    scope = 'fifteen'
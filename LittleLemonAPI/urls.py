@@ -1,14 +1,31 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('categories', views.CategoryView.as_view(), name='categories'),
     path('categories/<int:pk>', views.SingleCategoryView.as_view(), name='single-category'),
     path('menu-items', views.MenuItemView.as_view(), name='menu-items'),
     path('menu-items/<int:pk>', views.SingleMenuItemView.as_view(), name='single-menu-item'),
+    path('menu-items/import', views.MenuItemImportView.as_view(), name='menu-item-import'),
+    path('menu/snapshot', views.MenuSnapshotView.as_view(), name='menu-snapshot'),
     path('cart/menu-items', views.CartView.as_view(), name='cart'),
     path('orders', views.OrderView.as_view(), name='orders'),
     path('orders/<int:pk>', views.SingleOrderView.as_view(), name='single-order'),
+    path('orders/assignments', views.OrderAssignmentView.as_view(), name='order-assignments'),
+    path('orders/deliveries', views.OrderDeliveryView.as_view(), name='order-deliveries'),
+    path('orders/export.<str:export_format>', views.OrderExportView.as_view(), name='order-export'),
+
+    path('async/menu-items', async_views.AsyncMenuItemView.as_view(), name='async-menu-items'),
+    path('async/orders', async_views.AsyncOrderView.as_view(), name='async-orders'),
+    path('async/orders/<int:pk>', async_views.AsyncSingleOrderView.as_view(), name='async-single-order'),
+    path('orders/events', async_views.OrderEventStreamView.as_view(), name='order-events'),
+
+    path('reports/sales/daily', views.DailySalesReportView.as_view(), name='report-daily-sales'),
+    path('reports/sales/menu-items', views.MenuItemSalesReportView.as_view(), name='report-menu-item-sales'),
+    path('reports/sales/categories', views.CategorySalesReportView.as_view(), name='report-category-sales'),
+    path('reports/delivery-crew', views.DeliveryCrewReportView.as_view(), name='report-delivery-crew'),
+
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
 
     #M groups
     path('groups/manager/users', views.ManagerView.as_view(), name='manager-users'),
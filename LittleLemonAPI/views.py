@@ -1,6 +1,9 @@
 from django.shortcuts import render, get_object_or_404
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.views import View
 from datetime import datetime
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
 from django.core.paginator import Paginator, EmptyPage
 from django.contrib.auth.models import User, Group
 from .models import *
@@ -11,11 +14,27 @@ from rest_framework import generics
 from .serializers import *
 from .filters import *
 from .throttles import FifteenCallsPerMinute
-from .paginations import MenuItemPagination
+from .paginations import MenuItemPagination, OrderCursorPagination, get_order_page_size
+from .loaders import with_order_relations, load_orders
+from .fast_serializers import RowListMixin, cart_rows, menu_item_rows, order_rows
+from .permissions import IsDeliveryCrew, IsManager
+from .caching import CatalogCacheMixin
+from .snapshots import menu_snapshot_response
+from .checkout import EmptyCart, checkout
+from .menu_import import CSVParser, import_menu
+from .renderers import MessagePackParser, ORJSONParser
+from .exports import EXPORT_FORMATS, export_orders
+from .archive import order_by_id, order_detail_sources, order_source_rows, order_sources
+from .assignments import AutoAssignSerializer, assign_orders, auto_assign
+from .deliveries import DeliverySerializer, mark_delivered
+from .metrics import prometheus_text, registry
+from .events import ORDER_ASSIGNED, ORDER_DELIVERED, publish_order_event
+from .rollups import record_assignment, record_delivery
+from .roles import DELIVERY_CREW, get_roles, get_user_roles, is_manager, is_delivery_crew
 from rest_framework import status
 
 # region Category
-class CategoryView(generics.ListCreateAPIView):
+class CategoryView(CatalogCacheMixin, generics.ListCreateAPIView):
     queryset = Category.objects.all().order_by('id')
     serializer_class = CategorySerializer
     # permission_classes = (IsAuthenticated,)
@@ -26,33 +45,34 @@ class CategoryView(generics.ListCreateAPIView):
         return super().get_permissions()
 
     def create(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
+        if not is_manager(request):
             return Response({'message': 'Only managers can create categories'}, status=status.HTTP_403_FORBIDDEN)
 
         return super().create(request, *args, **kwargs)
 
-class SingleCategoryView(generics.RetrieveUpdateDestroyAPIView):
+class SingleCategoryView(CatalogCacheMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = (IsAuthenticated,)
 
     def update(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
+        if not is_manager(request):
             return Response({'message': 'Only managers can update categories'}, status=status.HTTP_403_FORBIDDEN)
 
         return super().update(request, *args, **kwargs)
 
     def destroy(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
+        if not is_manager(request):
             return Response({'message': 'Only managers can delete categories'}, status=status.HTTP_403_FORBIDDEN)
 
         return super().destroy(request, *args, **kwargs)
 
 # region MenuItem
-class MenuItemView(generics.ListCreateAPIView):
+class MenuItemView(CatalogCacheMixin, RowListMixin, generics.ListCreateAPIView):
     throttle_classes = (FifteenCallsPerMinute,)
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
+    row_serializer = menu_item_rows
     filterset_class = MenuItemFilter
     # permission_classes = (IsAuthenticated,)
     ordering_fields = ['price', 'title', 'featured', 'category']
@@ -69,42 +89,55 @@ class MenuItemView(generics.ListCreateAPIView):
         return filters.qs
 
     def create(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
+        if not is_manager(request):
             return Response({'message': 'Only managers can create menu items'}, status=status.HTTP_403_FORBIDDEN)
 
         return super().create(request, *args, **kwargs)
 
-class SingleMenuItemView(generics.RetrieveUpdateDestroyAPIView):
+class SingleMenuItemView(CatalogCacheMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
     permission_classes = (IsAuthenticated,)
 
     def update(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
+        if not is_manager(request):
             return Response({'message': 'Only managers can update menu items'}, status=status.HTTP_403_FORBIDDEN)
 
         return super().update(request, *args, **kwargs)
 
     def destroy(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
+        if not is_manager(request):
             return Response({'message': 'Only managers can delete menu items'}, status=status.HTTP_403_FORBIDDEN)
 
         return super().destroy(request, *args, **kwargs)
 
+class MenuItemImportView(generics.GenericAPIView):
+    """Create or update many menu items at once from a JSON list or a CSV body."""
+    permission_classes = (IsAuthenticated, IsManager)
+    parser_classes = (ORJSONParser, MessagePackParser, CSVParser)
+
+    def post(self, request, *args, **kwargs):
+        ok, report = import_menu(request.data)
+        return Response(report, status=status.HTTP_200_OK if ok else status.HTTP_400_BAD_REQUEST)
+
+# region Menu snapshot
+class MenuSnapshotView(View):
+    """Every category and menu item in one pre-rendered, pre-compressed response.
+
+    A plain Django view: no authentication, throttling or content
+    negotiation to run for what is the same file for everyone.
+    """
+
+    def get(self, request, *args, **kwargs):
+        return menu_snapshot_response(request)
+
 # region Manager
 class ManagerView(generics.ListCreateAPIView):
     queryset = User.objects.filter(groups__name='Manager').order_by('id')
     serializer_class = GroupSerializer
-    permission_classes = (IsAuthenticated,)
-
-    def get(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
-            return Response({'message': 'Only managers can access'}, status=status.HTTP_403_FORBIDDEN)
-        return super().get(request, *args, **kwargs)
+    permission_classes = (IsAuthenticated, IsManager)
 
     def create(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
-            return Response({'message': 'Only managers can access'}, status=status.HTTP_403_FORBIDDEN)
         manager_group = Group.objects.get(name='Manager')
         user = get_object_or_404(User, username=request.data.get('username'))
         manager_group.user_set.add(user)
@@ -113,11 +146,9 @@ class ManagerView(generics.ListCreateAPIView):
 class SingleManagerView(generics.DestroyAPIView):
     queryset = User.objects.filter(groups__name='Manager')
     serializer_class = GroupSerializer
-    permission_classes = (IsAuthenticated,)
+    permission_classes = (IsAuthenticated, IsManager)
 
     def destroy(self, request, pk, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
-            return Response({'message': 'Only managers can access'}, status=status.HTTP_403_FORBIDDEN)
         manager_group = Group.objects.get(name='Manager')
         user = get_object_or_404(User, pk=pk)
         manager_group.user_set.remove(user)
@@ -127,16 +158,9 @@ class SingleManagerView(generics.DestroyAPIView):
 class DeliveryCrewView(generics.ListCreateAPIView):
     queryset = User.objects.filter(groups__name='Delivery crew').order_by('id')
     serializer_class = GroupSerializer
-    permission_classes = (IsAuthenticated,)
-
-    def get(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
-            return Response({'message': 'Only managers can access'}, status=status.HTTP_403_FORBIDDEN)
-        return super().get(request, *args, **kwargs)
+    permission_classes = (IsAuthenticated, IsManager)
 
     def create(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
-            return Response({'message': 'Only managers can access'}, status=status.HTTP_403_FORBIDDEN)
         delivery_crew_group = Group.objects.get(name='Delivery crew')
         user = get_object_or_404(User, username=request.data.get('username'))
         delivery_crew_group.user_set.add(user)
@@ -145,19 +169,18 @@ class DeliveryCrewView(generics.ListCreateAPIView):
 class SingleDeliveryCrewView(generics.DestroyAPIView):
     queryset = User.objects.filter(groups__name='Delivery crew')
     serializer_class = GroupSerializer
-    permission_classes = (IsAuthenticated,)
+    permission_classes = (IsAuthenticated, IsManager)
 
     def destroy(self, request, pk, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
-            return Response({'message': 'Only managers can access'}, status=status.HTTP_403_FORBIDDEN)
         delivery_crew_group = Group.objects.get(name='Delivery crew')
         user = get_object_or_404(User, pk=pk)
         delivery_crew_group.user_set.remove(user)
         return Response({'message': 'User removed from delivery crew group'})
 
 # region Cart
-class CartView(generics.ListCreateAPIView):
+class CartView(RowListMixin, generics.ListCreateAPIView):
     serializer_class = CartSerializer
+    row_serializer = cart_rows
     permission_classes = (IsAuthenticated,)
 
     def get_queryset(self):
@@ -182,70 +205,39 @@ class OrderView(generics.ListCreateAPIView):
     serializer_class = OrderSerializer
     permission_classes = (IsAuthenticated,)
     throttle_classes = (FifteenCallsPerMinute,)
-    ordering_fields = ['user_id', 'delivery_crew', 'status', 'total', 'date']
+    ordering_fields = list(ORDER_ORDERINGS)
 
     def get(self, request, *args, **kwargs):
-        if request.user.groups.filter(name='Manager').exists():
-            orders = Order.objects.all()
-        elif request.user.groups.filter(name='Delivery crew').exists():
-            orders = Order.objects.filter(delivery_crew=request.user)
-        else:
-            orders = Order.objects.filter(user=request.user)
-
-        status_param = request.query_params.get('status')
-        date_param = request.query_params.get('date')
-        ordering = request.query_params.get('ordering')
-        perpage = min(int(request.query_params.get('perpage', default=3)),5)
+        # Recent and open orders; archived ones too when a date filter asks for them
+        sources = order_sources(request.user, get_roles(request), request.query_params)
+        archive = len(sources) > 1
+        perpage = get_order_page_size(request.query_params)
         page = request.query_params.get('page', default=1)
-        if ordering:
-            ordering_fields = ordering.split(',')
-            orders = orders.order_by(*ordering_fields)
-        if date_param:
-            try:
-                # Convert string date to datetime.date object
-                date = datetime.strptime(date_param, '%d-%m-%Y').date()
-                start_date = datetime.combine(date, datetime.min.time())
-                end_date = datetime.combine(date, datetime.max.time()).replace(microsecond=0)
-                orders = orders.filter(date__range=(start_date, end_date))
-            except ValueError:
-                return Response({'message': 'Invalid date format. Use DD-MM-YYYY'}, status=status.HTTP_400_BAD_REQUEST)
-        if status_param:
-            try:
-                status_param = serializers.BooleanField().to_internal_value(status_param)
-                orders = orders.filter(status=status_param)
-            except serializers.ValidationError:
-                return Response({'message': 'Invalid value for status parameter'}, status=status.HTTP_400_BAD_REQUEST)
-
-        paginator = Paginator(orders, per_page=perpage)
+        ordering = request.query_params.get('ordering')
+
+        if 'cursor' in request.query_params:
+            paginator = OrderCursorPagination(page_size=perpage)
+            orders = paginator.paginate_querysets([order_rows.values(source) for source in sources], request, ordering=ordering)
+            return Response(paginator.get_paginated_response_data(load_orders(orders, archive)), status=status.HTTP_200_OK)
+
+        paginator = Paginator(order_source_rows(sources, ordering), per_page=perpage)
         try:
             orders = paginator.page(number=page)
         except EmptyPage:
             orders = []
-        # Fetch order items for each order
-        orders_with_items = []
-        for order in orders:
-            order_items = OrderItem.objects.filter(order=order)
-            order_item_serializer = OrderItemSerializer(order_items, many=True)
-            order_data = OrderSerializer(order).data
-            order_data['order_items'] = order_item_serializer.data
-            orders_with_items.append(order_data)
+        # Orders, items, menu items, categories and crew users in a fixed number of queries
+        orders_with_items = load_orders(orders, archive)
         return Response(orders_with_items, status=status.HTTP_200_OK)
 
-    def perform_create(self, serializer):
-        carts = Cart.objects.filter(user=self.request.user)
-        total = sum(cart.price for cart in carts)
-
-        order = serializer.save(total=total, user=self.request.user)
-        for cart in carts:
-            order_item = OrderItem.objects.create(
-                order=order,
-                menuitem=cart.menuitem,
-                quantity=cart.quantity,
-                unit_price=cart.unit_price,
-                price=cart.price
-            )
-            cart.delete()
+    def create(self, request, *args, **kwargs):
+        try:
+            return super().create(request, *args, **kwargs)
+        except EmptyCart:
+            return Response({'message': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
 
+    def perform_create(self, serializer):
+        user = self.request.user
+        checkout(user, lambda total: serializer.save(total=total, user=user))
         return serializer.instance
 
 class SingleOrderView(generics.RetrieveUpdateDestroyAPIView):
@@ -254,45 +246,157 @@ class SingleOrderView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = (IsAuthenticated,)
 
     def get(self, request, pk, *args, **kwargs):
-        if request.user.groups.filter(name='Manager').exists():
-            exac_order = get_object_or_404(Order,pk=pk)
+        # Orders moved by archive_orders are found in the archive
+        sources = order_detail_sources(request.user, get_roles(request))
+        if is_manager(request):
+            exac_order, _ = order_by_id([with_order_relations(source) for source in sources], pk)
+            if exac_order is None:
+                raise Http404('No Order matches the given query.')
             serializer = OrderSerializer(exac_order)
             return Response(serializer.data, status=status.HTTP_200_OK)
-        elif request.user.groups.filter(name='Delivery crew').exists():
-            orders_to_deliver = Order.objects.filter(delivery_crew=request.user, pk=pk)
-            serializer = OrderSerializer(orders_to_deliver, many=True)
+        elif is_delivery_crew(request):
+            order_to_deliver, _ = order_by_id([with_order_relations(source) for source in sources], pk)
+            serializer = OrderSerializer([order_to_deliver] if order_to_deliver else [], many=True)
             return Response(serializer.data, status=status.HTTP_200_OK)
         else:
-            customer_order = get_object_or_404(Order, user=request.user, pk=pk)
-            order_serializer = OrderSerializer(customer_order)
-            customer_orderitems = OrderItem.objects.filter(order=pk)
-            orderitem_serializer = OrderItemSerializer(customer_orderitems, many=True)
-            order_data = order_serializer.data
-            order_data['order_items'] = orderitem_serializer.data
+            customer_order, archived = order_by_id([order_rows.values(source) for source in sources], pk)
+            if customer_order is None:
+                raise Http404('No Order matches the given query.')
+            order_data = load_orders([customer_order], archived)[0]
             return Response(order_data, status=status.HTTP_200_OK)
 
     def partial_update(self, request, pk, *args, **kwargs):
-        if request.user.groups.filter(name='Manager').exists():
+        if is_manager(request):
             if 'delivery_crew_id' in request.data:
-                order = get_object_or_404(Order, pk=pk)
                 delivery = get_object_or_404(User, pk=request.data['delivery_crew_id'])
-                if delivery.groups.filter(name='Delivery crew').exists():
-                    order.delivery_crew_id = request.data['delivery_crew_id']
-                    order.save()
+                if DELIVERY_CREW in get_user_roles(delivery):
+                    with transaction.atomic():
+                        order = get_object_or_404(Order.objects.select_for_update(), pk=pk)
+                        previous_crew_id = order.delivery_crew_id
+                        order.delivery_crew = delivery
+                        order.save()
+                        record_assignment(order, previous_crew_id)
+                    publish_order_event(order, ORDER_ASSIGNED)
                     return Response(OrderSerializer(order).data, status= status.HTTP_200_OK)
                 return Response({'message': 'Invalid delivery crew'}, status=status.HTTP_400_BAD_REQUEST)
-        elif request.user.groups.filter(name='Delivery crew').exists():
-            order = get_object_or_404(Order.objects.filter(delivery_crew=request.user, pk=pk))
-            if order.status == 0:
-                order.status = 1
-                order.save()
+        elif is_delivery_crew(request):
+            with transaction.atomic():
+                order = get_object_or_404(Order.objects.select_for_update().filter(delivery_crew=request.user, pk=pk))
+                delivered = order.status == 0
+                if delivered:
+                    order.status = 1
+                    order.save()
+                    record_delivery(order)
+            if delivered:
+                publish_order_event(order, ORDER_DELIVERED)
                 return Response({'message': 'Order status updated to "Delivered"'}, status=status.HTTP_200_OK)
             return Response({'message': 'Order status already updated'}, status=status.HTTP_200_OK)
         else:
             return super().partial_update(request, *args, **kwargs)
 
     def destroy(self, request, *args, **kwargs):
-        if not request.user.groups.filter(name='Manager').exists():
+        if not is_manager(request):
             return Response({'message': 'Only managers can delete orders'}, status=status.HTTP_403_FORBIDDEN)
 
-        return super().destroy(request, *args, **kwargs)
\ No newline at end of file
+        # The rollup job queued by the pre_delete signal commits only with the delete
+        with transaction.atomic():
+            return super().destroy(request, *args, **kwargs)
+
+class OrderAssignmentView(generics.GenericAPIView):
+    """Assign delivery crew to many orders at once, or spread the unassigned ones across the crew."""
+    permission_classes = (IsAuthenticated, IsManager)
+
+    def post(self, request, *args, **kwargs):
+        if isinstance(request.data, dict) and 'auto' in request.data:
+            options = AutoAssignSerializer(data=request.data)
+            options.is_valid(raise_exception=True)
+            if not options.validated_data['auto']:
+                return Response({'message': 'Set "auto" to true, or send "assignments"'}, status=status.HTTP_400_BAD_REQUEST)
+            ok, report = auto_assign(options.validated_data['limit'])
+        else:
+            ok, report = assign_orders(request.data.get('assignments') if isinstance(request.data, dict) else None)
+        return Response(report, status=status.HTTP_200_OK if ok else status.HTTP_400_BAD_REQUEST)
+
+class OrderDeliveryView(generics.GenericAPIView):
+    """Mark many of the delivery crew member's orders delivered in one request."""
+    permission_classes = (IsAuthenticated, IsDeliveryCrew)
+
+    def post(self, request, *args, **kwargs):
+        serializer = DeliverySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'results': mark_delivered(request.user, serializer.validated_data['ids'])}, status=status.HTTP_200_OK)
+
+class OrderExportView(generics.GenericAPIView):
+    """All matching orders and their items as a CSV or NDJSON download, streamed in chunks."""
+    permission_classes = (IsAuthenticated, IsManager)
+
+    def perform_content_negotiation(self, request, force=False):
+        # The export is not rendered by DRF; errors are JSON whatever the Accept header says
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, export_format, *args, **kwargs):
+        if export_format not in EXPORT_FORMATS:
+            raise Http404
+        # The whole history, archived orders included
+        sources = [filter_orders(model.objects.all(), request.query_params) for model in (Order, ArchivedOrder)]
+        response = StreamingHttpResponse(export_orders(sources, export_format), content_type=EXPORT_FORMATS[export_format][1])
+        response['Content-Disposition'] = f'attachment; filename="orders.{export_format}"'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+# region Reports
+class ReportView(generics.ListAPIView):
+    permission_classes = (IsAuthenticated, IsManager)
+    pagination_class = None
+
+    def get_range(self):
+        return report_range(self.request.query_params)
+
+class DailySalesReportView(ReportView):
+    serializer_class = DailySalesSerializer
+
+    def get_queryset(self):
+        return DailySales.objects.filter(date__range=self.get_range()).order_by('date')
+
+class MenuItemSalesReportView(ReportView):
+    serializer_class = MenuItemSalesSerializer
+
+    def get_queryset(self):
+        return (
+            DailyMenuItemSales.objects.filter(date__range=self.get_range())
+            .values('menuitem_id', title=F('menuitem__title'))
+            .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+            .order_by('-revenue', 'menuitem_id')
+        )
+
+class CategorySalesReportView(ReportView):
+    serializer_class = CategorySalesSerializer
+
+    def get_queryset(self):
+        # Derived from the per-item rollup, so moving an item to another
+        # category moves its history with it
+        return (
+            DailyMenuItemSales.objects.filter(date__range=self.get_range())
+            .values(category_id=F('menuitem__category_id'), title=F('menuitem__category__title'))
+            .annotate(quantity=Sum('quantity'), revenue=Sum('revenue'))
+            .order_by('-revenue', 'category_id')
+        )
+
+class DeliveryCrewReportView(ReportView):
+    serializer_class = DeliveryCrewStatsSerializer
+
+    def get_queryset(self):
+        return (
+            DailyDeliveryCrewStats.objects.filter(date__range=self.get_range())
+            .values('delivery_crew_id', username=F('delivery_crew__username'))
+            .annotate(assigned=Sum('assigned'), delivered=Sum('delivered'))
+            .order_by('-delivered', 'delivery_crew_id')
+        )
+
+# region Metrics
+class MetricsView(generics.GenericAPIView):
+    """Request counts and latency, database time and query count histograms per route, for Prometheus."""
+    permission_classes = (IsAuthenticated, IsManager)
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(prometheus_text(registry.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,120 @@
+"""p99 latency of the sync and async read paths under many concurrent clients.
+
+Each client holds its own keep-alive connection, so the number of clients is
+the number of connections the server has to keep open. Serve the project on
+ASGI with throttling effectively off, for example
+
+    GUNICORN_ASGI=1 THROTTLE_ANON_RATE=1000000/minute \\
+    THROTTLE_USER_RATE=1000000/minute THROTTLE_FIFTEEN_RATE=1000000/minute \\
+    gunicorn -c gunicorn.conf.py
+
+then run
+
+    python -m benchmarks.async_load --url http://localhost:8000 \\
+        --username admin --password secret --clients 500 --duration 20
+
+Every sync path is followed by its /api/async/ counterpart, so both are
+measured against the same server and data.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+from .throughput import login
+
+DEFAULT_PATHS = ['/api/orders', '/api/orders/1', '/api/menu-items']
+
+async def request(reader, writer, host, path, token):
+    headers = f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n'
+    if token:
+        headers += f'Authorization: Token {token}\r\n'
+    writer.write((headers + '\r\n').encode())
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed by server')
+    length, chunked = 0, False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(length)
+    return int(status_line.split()[1])
+
+async def run(url, path, token, clients, duration):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    deadline = time.monotonic() + duration
+    latencies, errors = [], 0
+
+    async def client():
+        nonlocal errors
+        connection = None
+        while time.monotonic() < deadline:
+            try:
+                if connection is None:
+                    connection = await asyncio.open_connection(host, port)
+                start = time.perf_counter()
+                status = await request(*connection, f'{host}:{port}', path, token)
+            except (OSError, ValueError, asyncio.IncompleteReadError):
+                errors += 1
+                if connection is not None:
+                    connection[1].close()
+                connection = None
+                continue
+            if status == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+        if connection is not None:
+            connection[1].close()
+
+    await asyncio.gather(*(client() for _ in range(clients)))
+
+    latencies.sort()
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)] if latencies else 0
+    return {
+        'path': path,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / duration,
+        'p50_ms': statistics.median(latencies) if latencies else 0,
+        'p99_ms': p99,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--path', action='append', dest='paths', help='Sync path to compare, may be repeated')
+    args = parser.parse_args()
+
+    token = login(args.url, args.username, args.password) if args.username else None
+    for path in args.paths or DEFAULT_PATHS:
+        for variant in (path, path.replace('/api/', '/api/async/', 1)):
+            result = asyncio.run(run(args.url, variant, token, args.clients, args.duration))
+            print(
+                f"{result['path']:<28} {result['requests']:>7} req  {result['rps']:>8.1f} req/s  "
+                f"p50 {result['p50_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  errors {result['errors']}"
+            )
+
+if __name__ == '__main__':
+    main()
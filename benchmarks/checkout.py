@@ -0,0 +1,112 @@
+"""Checkout latency under concurrency, with the rollups queued as jobs vs updated inline.
+
+    python -m benchmarks.checkout --clients 32 --orders 50
+
+Every client places orders for the same few menu items, so inline every
+checkout adds onto the same daily rollup rows and waits for the row locks
+of the checkouts before it until they commit. Queued, a checkout inserts
+one job row, and a run_jobs worker thread adds the jobs up meanwhile. The
+cart lines are created outside the timed request. It needs PostgreSQL: the
+SQLite test database is shared in memory and locks whole tables.
+"""
+import argparse
+import threading
+import time
+from unittest.mock import patch
+
+from benchmarks.utils import setup_django, test_database
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--orders', type=int, default=50, help='Orders per client')
+    parser.add_argument('--menu-items', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.db import connection, connections
+    from rest_framework.test import APIClient
+    from LittleLemonAPI.jobs import run_jobs
+    from LittleLemonAPI.models import Cart, Category, DailySales, Job, MenuItem
+    from LittleLemonAPI.rollups import RollupChanges
+    from LittleLemonAPI.views import OrderView
+
+    if connection.vendor != 'postgresql':
+        parser.error(f'needs PostgreSQL, not {connection.vendor}')
+    OrderView.throttle_classes = ()
+
+    def place_orders(user, menu_items, latencies, errors):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        try:
+            for _ in range(args.orders):
+                Cart.objects.bulk_create(
+                    Cart(user=user, menuitem=item, quantity=1, unit_price=item.price, price=item.price) for item in menu_items
+                )
+                start = time.perf_counter()
+                response = client.post('/api/orders', {})
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 201:
+                    errors.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    def work(stop):
+        try:
+            while not stop.is_set():
+                if not run_jobs()[0]:
+                    time.sleep(0.05)
+        finally:
+            connections.close_all()
+
+    def run(users, menu_items, queued):
+        latencies, errors = [], []
+        stop = threading.Event()
+        worker = threading.Thread(target=work, args=(stop,))
+        clients = [threading.Thread(target=place_orders, args=(user, menu_items, latencies, errors)) for user in users]
+        start = time.perf_counter()
+        if queued:
+            worker.start()
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        if queued:
+            worker.join()
+        left = Job.objects.count()
+        drain = time.perf_counter()
+        while run_jobs()[0]:
+            pass
+        drain = (time.perf_counter() - drain) * 1000
+        latencies.sort()
+        return {
+            'orders/s': len(latencies) / elapsed,
+            'p50': latencies[len(latencies) // 2],
+            'p99': latencies[max(0, int(len(latencies) * 0.99) - 1)],
+            'errors': len(errors),
+            'left': left,
+            'drain': drain,
+        }
+
+    with test_database():
+        category = Category.objects.create(slug='mains', title='Mains')
+        menu_items = [MenuItem.objects.create(title=f'Item {i}', price=10, featured=False, category=category) for i in range(args.menu_items)]
+        users = [User.objects.create_user(username=f'client-{i}', password='password') for i in range(args.clients)]
+
+        print(f'{"rollups":<8} {"orders/s":>9} {"p50":>9} {"p99":>9} {"errors":>7} {"jobs left":>10}')
+        for name, queued in (('inline', False), ('queued', True)):
+            if queued:
+                result = run(users, menu_items, queued)
+            else:
+                with patch.object(RollupChanges, 'queue', RollupChanges.apply):
+                    result = run(users, menu_items, queued)
+            print(f'{name:<8} {result["orders/s"]:>9.1f} {result["p50"]:>7.2f}ms {result["p99"]:>7.2f}ms {result["errors"]:>7} '
+                  f'{result["left"]:>10} ({result["drain"]:.0f}ms to drain)')
+        # Both runs counted every order
+        assert DailySales.objects.get().orders == 2 * args.clients * args.orders
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+"""Query count, latency and memory of every route in LittleLemonAPI/urls.py, checked against a baseline.
+
+    python -m benchmarks.endpoints --scale 0.01 --write-baseline endpoints.json
+    python -m benchmarks.endpoints --scale 0.01 --baseline endpoints.json
+
+The throwaway test database is filled by the seed_load generator at the
+given scale, then each case is called in process with token
+authentication, after one warm-up call: once to count queries, once under
+tracemalloc for the peak memory allocated, and --repeat times for the
+p50/p95 latency. Throttling is turned off.
+
+With --baseline, the run exits with status 1 when any endpoint makes more
+queries than the baseline, or its p95 latency or peak memory grows by more
+than --threshold (and by more than a small absolute amount, to ignore
+noise). Compare runs made at the same scale, on the same database backend
+and machine. A route without a case here also fails the run, so new
+routes have to be added.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from itertools import count
+
+from benchmarks.utils import setup_django, test_database
+
+# Below these, a difference is treated as noise whatever the threshold
+MIN_LATENCY_MS = 1.0
+MIN_MEMORY_KB = 64
+
+class Case:
+    """One request to benchmark; prepare() runs before every call, untimed, and may return fresh kwargs/data."""
+
+    def __init__(self, name, route, method='get', user=None, kwargs=None, query='', data=None, status=200, prepare=None, stream=False):
+        self.name = name
+        self.route = route
+        self.method = method
+        self.user = user
+        self.kwargs = kwargs or {}
+        self.query = query
+        self.data = data
+        self.status = status
+        self.prepare = prepare
+        self.stream = stream
+
+def build_cases(seeder):
+    from django.contrib.auth.models import Group, User
+    from LittleLemonAPI.models import Cart, Category, MenuItem, Order, OrderItem
+    from LittleLemonAPI.roles import DELIVERY_CREW, MANAGER
+
+    manager = User.objects.get(pk=seeder.managers[0])
+    crew = User.objects.get(pk=seeder.delivery_crew[0])
+    # Customers are drawn with a skew, so the first one has the most orders
+    customer = User.objects.get(pk=seeder.customers[0])
+    shopper = User.objects.get(pk=Cart.objects.values_list('user_id', flat=True).order_by('user_id').first())
+    buyer = User.objects.get(pk=seeder.customers[-1])
+    category = Category.objects.get(pk=seeder.categories[0])
+    menu_item = MenuItem.objects.get(pk=seeder.menu_items[0][0])
+    order = Order.objects.filter(user=customer).order_by('-date').first()
+    crew_order = Order.objects.filter(delivery_crew=crew).order_by('-date').first()
+    other = User.objects.get(pk=seeder.customers[1])
+    manager_group, crew_group = Group.objects.get(name=MANAGER), Group.objects.get(name=DELIVERY_CREW)
+    numbers = count()
+
+    def new_category():
+        return {'kwargs': {'pk': Category.objects.create(slug=f'bench-{next(numbers)}', title='Bench').pk}}
+
+    def new_menu_item():
+        return {'kwargs': {'pk': MenuItem.objects.create(title='Bench', price=5, featured=False, category=category).pk}}
+
+    def empty_cart():
+        Cart.objects.filter(user=buyer).delete()
+
+    def fill_cart():
+        empty_cart()
+        Cart.objects.bulk_create(
+            Cart(user=buyer, menuitem_id=pk, quantity=2, unit_price=price, price=price * 2) for pk, price in seeder.menu_items[:3]
+        )
+
+    def new_order():
+        new = Order.objects.create(user=other, total=10)
+        OrderItem.objects.create(order=new, menuitem=menu_item, quantity=1, unit_price=10, price=10)
+        return {'kwargs': {'pk': new.pk}}
+
+    def undelivered():
+        Order.objects.filter(pk=crew_order.pk).update(status=False)
+
+    open_orders = list(Order.objects.filter(status=False).order_by('-date').values_list('pk', flat=True)[:50])
+    assignments = [{'order_id': pk, 'delivery_crew_id': seeder.delivery_crew[i % len(seeder.delivery_crew)]} for i, pk in enumerate(open_orders)]
+
+    crew_run = list(Order.objects.filter(delivery_crew=crew).order_by('-date').values_list('pk', flat=True)[:20])
+
+    def run_undelivered():
+        Order.objects.filter(pk__in=crew_run).update(status=False)
+
+    def unassigned():
+        # At least these are left for auto-assignment to hand out
+        Order.objects.filter(pk__in=open_orders).update(delivery_crew=None)
+
+    menu_rows = [{'id': pk, 'title': f'Imported {pk}', 'price': str(price), 'category': category.slug} for pk, price in seeder.menu_items[:100]]
+    return [
+        Case('categories', 'categories'),
+        Case('categories: create', 'categories', 'post', manager, status=201,
+             prepare=lambda: {'data': {'slug': f'bench-{next(numbers)}', 'title': 'Bench'}}),
+        Case('category', 'single-category', user=customer, kwargs={'pk': category.pk}),
+        Case('category: update', 'single-category', 'patch', manager, kwargs={'pk': category.pk}, data={'title': category.title}),
+        Case('category: delete', 'single-category', 'delete', manager, status=204, prepare=new_category),
+        Case('menu items', 'menu-items'),
+        Case('menu items: search', 'menu-items', query='?search=Risotto&ordering=price'),
+        Case('menu items: create', 'menu-items', 'post', manager, status=201,
+             data={'title': 'Bench', 'price': '5.00', 'featured': False, 'category_id': category.pk}),
+        Case('menu item', 'single-menu-item', user=customer, kwargs={'pk': menu_item.pk}),
+        Case('menu item: update', 'single-menu-item', 'patch', manager, kwargs={'pk': menu_item.pk}, data={'featured': True}),
+        Case('menu item: delete', 'single-menu-item', 'delete', manager, status=204, prepare=new_menu_item),
+        Case('menu snapshot', 'menu-snapshot'),
+        Case('menu items: import 100', 'menu-item-import', 'post', manager, data=menu_rows),
+        Case('cart', 'cart', user=shopper),
+        Case('cart: add', 'cart', 'post', buyer, status=201, data={'menuitem_id': menu_item.pk, 'quantity': 2},
+             prepare=empty_cart),
+        Case('cart: clear', 'cart', 'delete', buyer, prepare=fill_cart),
+        Case('orders: customer', 'orders', user=customer),
+        Case('orders: delivery crew', 'orders', user=crew),
+        Case('orders: manager', 'orders', user=manager),
+        Case('orders: manager, cursor', 'orders', user=manager, query='?cursor=&status=0'),
+        Case('orders: checkout', 'orders', 'post', buyer, status=201, prepare=fill_cart),
+        Case('order: customer', 'single-order', user=customer, kwargs={'pk': order.pk}),
+        Case('order: manager', 'single-order', user=manager, kwargs={'pk': order.pk}),
+        Case('order: assign', 'single-order', 'patch', manager, kwargs={'pk': crew_order.pk}, data={'delivery_crew_id': crew.pk}),
+        Case('order: deliver', 'single-order', 'patch', crew, kwargs={'pk': crew_order.pk}, prepare=undelivered),
+        Case('order: delete', 'single-order', 'delete', manager, status=204, prepare=new_order),
+        Case('orders: assign 50', 'order-assignments', 'post', manager, data={'assignments': assignments}),
+        Case('orders: deliver 20', 'order-deliveries', 'post', crew, data={'ids': crew_run}, prepare=run_undelivered),
+        Case('orders: auto-assign 50', 'order-assignments', 'post', manager, data={'auto': True, 'limit': 50}, prepare=unassigned),
+        Case('orders: export csv', 'order-export', user=manager, kwargs={'export_format': 'csv'}),
+        Case('orders: export ndjson', 'order-export', user=manager, kwargs={'export_format': 'ndjson'}),
+        Case('async menu items', 'async-menu-items'),
+        Case('async orders', 'async-orders', user=customer),
+        Case('async order', 'async-single-order', user=customer, kwargs={'pk': order.pk}),
+        Case('order events: first message', 'order-events', user=customer, stream=True),
+        Case('report: daily sales', 'report-daily-sales', user=manager),
+        Case('report: menu items', 'report-menu-item-sales', user=manager),
+        Case('report: categories', 'report-category-sales', user=manager),
+        Case('report: delivery crew', 'report-delivery-crew', user=manager),
+        Case('metrics', 'metrics', user=manager),
+        Case('managers', 'manager-users', user=manager),
+        Case('managers: add', 'manager-users', 'post', manager, data={'username': other.username}),
+        Case('managers: remove', 'single-manager', 'delete', manager, kwargs={'pk': other.pk},
+             prepare=lambda: manager_group.user_set.add(other)),
+        Case('delivery crew', 'delivery-crew-users', user=manager),
+        Case('delivery crew: add', 'delivery-crew-users', 'post', manager, data={'username': other.username}),
+        Case('delivery crew: remove', 'single-delivery-crew', 'delete', manager, kwargs={'pk': other.pk},
+             prepare=lambda: crew_group.user_set.add(other)),
+    ]
+
+def uncovered_routes(cases):
+    from LittleLemonAPI.urls import urlpatterns
+
+    return sorted({pattern.name for pattern in urlpatterns} - {case.route for case in cases})
+
+class Runner:
+    def __init__(self):
+        from asgiref.sync import async_to_sync
+        from rest_framework.authtoken.models import Token
+        from rest_framework.test import APIClient
+        from django.test import AsyncClient
+
+        self.client = APIClient()
+        self.async_client = AsyncClient()
+        self.first_chunk = async_to_sync(self.afirst_chunk)
+        self.tokens = {}
+        self.Token = Token
+
+    def headers(self, user):
+        if user is None:
+            return {}
+        if user.pk not in self.tokens:
+            self.tokens[user.pk] = self.Token.objects.get_or_create(user=user)[0].key
+        return {'Authorization': f'Token {self.tokens[user.pk]}'}
+
+    async def afirst_chunk(self, url, headers):
+        response = await self.async_client.get(url, headers=headers)
+        stream = aiter(response.streaming_content)
+        await anext(stream)
+        await stream.aclose()
+        return response
+
+    def prepare(self, case):
+        from django.urls import reverse
+
+        params = (case.prepare() if case.prepare else None) or {}
+        url = reverse(case.route, kwargs=params.get('kwargs', case.kwargs)) + case.query
+        return url, params.get('data', case.data), self.headers(case.user)
+
+    def call(self, case, url, data, headers):
+        if case.stream:
+            response = self.first_chunk(url, headers)
+        else:
+            response = getattr(self.client, case.method)(url, data, format='json', headers=headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        if response.status_code != case.status:
+            raise SystemExit(f'{case.name}: {case.method.upper()} {url} returned {response.status_code}, expected {case.status}')
+        return response
+
+    def measure(self, case, repeat):
+        from django.db import connection, reset_queries
+        from django.test.utils import CaptureQueriesContext
+
+        self.call(case, *self.prepare(case))
+
+        request = self.prepare(case)
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            self.call(case, *request)
+        # Read now: the log is cleared again when the next request starts
+        query_count = len(queries)
+
+        request = self.prepare(case)
+        tracemalloc.start()
+        try:
+            self.call(case, *request)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        timings = []
+        for _ in range(repeat):
+            request = self.prepare(case)
+            start = time.perf_counter()
+            self.call(case, *request)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return {
+            'queries': query_count,
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(timings[max(0, int(len(timings) * 0.95) - 1)], 3),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+def regressions(name, result, baseline, threshold):
+    found = []
+    if result['queries'] > baseline['queries']:
+        found.append(f'{name}: {baseline["queries"]} -> {result["queries"]} queries')
+    for key, unit, floor in (('p95_ms', 'ms p95', MIN_LATENCY_MS), ('peak_kb', 'KiB peak', MIN_MEMORY_KB)):
+        if result[key] > baseline[key] * (1 + threshold) and result[key] - baseline[key] > floor:
+            found.append(f'{name}: {baseline[key]} -> {result[key]} {unit}')
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=0.01, help='seed_load scale of the data set.')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', help='Baseline JSON to compare with.')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed relative growth of p95 latency and peak memory.')
+    parser.add_argument('--write-baseline', metavar='PATH', help='Write this run as the new baseline.')
+    parser.add_argument('--only', help='Only run the cases whose name contains this text.')
+    args = parser.parse_args()
+
+    for scope in ('ANON', 'USER', 'FIFTEEN'):
+        os.environ.setdefault(f'THROTTLE_{scope}_RATE', '1000000000/minute')
+    # As in production: no query log, no debug error pages
+    os.environ.setdefault('DJANGO_DEBUG', 'false')
+    setup_django()
+    from django.core.cache import cache
+    from django.db import connection
+    from LittleLemonAPI.seeding import LoadSeeder, seed_volumes
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    with test_database():
+        seeder = LoadSeeder(seed_volumes(args.scale), prefix='bench', seed=args.seed)
+        for what, created in seeder.run():
+            print(f'Seeded {created:,} {what}', file=sys.stderr)
+        cache.clear()
+        cases = build_cases(seeder)
+        missing = uncovered_routes(cases)
+        if missing:
+            raise SystemExit(f'No benchmark case for: {", ".join(missing)}')
+        if args.only:
+            cases = [case for case in cases if args.only in case.name]
+
+        meta = {'vendor': connection.vendor, 'scale': args.scale, 'seed': args.seed, 'python': platform.python_version()}
+        if baseline and {key: baseline['meta'].get(key) for key in ('vendor', 'scale')} != {key: meta[key] for key in ('vendor', 'scale')}:
+            raise SystemExit(f'The baseline was recorded with {baseline["meta"]}, this run is {meta}')
+
+        runner = Runner()
+        results, failures = {}, []
+        print(f'{"endpoint":<32} {"queries":>7} {"p50":>9} {"p95":>9} {"peak":>10}')
+        for case in cases:
+            result = results[case.name] = runner.measure(case, args.repeat)
+            print(f'{case.name:<32} {result["queries"]:>7} {result["p50_ms"]:>7.2f}ms {result["p95_ms"]:>7.2f}ms {result["peak_kb"]:>7.1f}KiB')
+            if baseline and case.name in baseline['endpoints']:
+                failures += regressions(case.name, result, baseline['endpoints'][case.name], args.threshold)
+
+    if args.write_baseline:
+        with open(args.write_baseline, 'w') as f:
+            json.dump({'meta': meta, 'endpoints': results}, f, indent=2)
+            f.write('\n')
+        print(f'Wrote {args.write_baseline}', file=sys.stderr)
+    if failures:
+        print('\nRegressions:', *failures, sep='\n  ', file=sys.stderr)
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
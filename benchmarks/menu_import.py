@@ -0,0 +1,51 @@
+"""Loading a menu: one POST per item vs the bulk import endpoint.
+
+    python -m benchmarks.menu_import --rows 10000 --single-rows 200
+"""
+import argparse
+import time
+
+from benchmarks.utils import setup_django, test_database
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--single-rows', type=int, default=200, help='Items POSTed one at a time, extrapolated to --rows')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import Group, User
+    from rest_framework.test import APIClient
+    from LittleLemonAPI.models import Category, MenuItem
+    from LittleLemonAPI.views import MenuItemImportView, MenuItemView
+
+    MenuItemView.throttle_classes = ()
+    MenuItemImportView.throttle_classes = ()
+
+    with test_database():
+        manager = User.objects.create_user(username='manager', password='password')
+        manager.groups.add(Group.objects.create(name='Manager'))
+        category = Category.objects.create(slug='mains', title='Mains')
+        client = APIClient()
+        client.force_authenticate(user=manager)
+
+        start = time.perf_counter()
+        for i in range(args.single_rows):
+            client.post('/api/menu-items', {'title': f'Single {i}', 'price': '9.99', 'featured': False, 'category_id': category.id})
+        single = (time.perf_counter() - start) / args.single_rows
+
+        rows = [{'title': f'Item {i}', 'price': '9.99', 'category': 'mains'} for i in range(args.rows)]
+        start = time.perf_counter()
+        created = client.post('/api/menu-items/import', rows, format='json').data
+        imported = time.perf_counter() - start
+        start = time.perf_counter()
+        updated = client.post('/api/menu-items/import', rows, format='json').data
+        reimported = time.perf_counter() - start
+
+        print(f'one POST per item   {single * args.rows:>8.2f}s for {args.rows} rows (extrapolated from {args.single_rows})')
+        print(f'import, new items   {imported:>8.2f}s  {created}')
+        print(f'import, same items  {reimported:>8.2f}s  {updated}')
+        print(f'menu items: {MenuItem.objects.count()}')
+
+if __name__ == '__main__':
+    main()
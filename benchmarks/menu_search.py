@@ -0,0 +1,97 @@
+"""?search= on a large menu: indexed search vs the old icontains filters.
+
+    python -m benchmarks.menu_search --items 100000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.utils import measure, setup_django, test_database
+
+SYLLABLES = 'ba be bi bo bu ka ke ki ko ku la le li lo lu ma me mi mo mu na ne ni no nu ra re ri ro ru sa se si so su ta te ti to tu'.split()
+
+def vocabulary(rng, size=20000):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(3, 4))))
+    return sorted(words)
+
+def seed_menu(items, categories, batch_size=5000):
+    from LittleLemonAPI.models import Category, MenuItem
+
+    rng = random.Random(42)
+    words = vocabulary(rng)
+    Category.objects.bulk_create(
+        Category(slug=f'category-{i}', title=rng.choice(words).title()) for i in range(categories)
+    )
+    category_ids = list(Category.objects.values_list('id', flat=True))
+    for offset in range(0, items, batch_size):
+        MenuItem.objects.bulk_create(
+            MenuItem(
+                title=' '.join(rng.sample(words, 3)).title(),
+                price=rng.randint(100, 5000) / 100,
+                featured=rng.random() < 0.1,
+                category_id=rng.choice(category_ids),
+            )
+            for i in range(offset, min(offset + batch_size, items))
+        )
+    return words
+
+def explain(queryset):
+    from django.db import connection
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN (ANALYZE, SUMMARY) ' + sql, params)
+        else:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=100000)
+    parser.add_argument('--categories', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.db.models import Q
+    from LittleLemonAPI.models import MenuItem
+    from LittleLemonAPI.search import search_menu_items
+
+    with test_database():
+        start = time.perf_counter()
+        words = seed_menu(args.items, args.categories)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        print(f'Seeded {args.items} items in {time.perf_counter() - start:.1f}s on {connection.vendor}\n')
+
+        # An exact word, a prefix and a word with one letter dropped
+        terms = [words[100], words[2000][:4], words[3000][:2] + words[3000][3:]]
+        for term in terms:
+            # What the endpoint does: a COUNT for the paginator, then the first page
+            def search():
+                queryset = search_menu_items(MenuItem.objects.all(), term)
+                return queryset.count(), list(queryset[:5])
+
+            def scan():
+                queryset = MenuItem.objects.filter(Q(title__icontains=term) | Q(category__title__icontains=term)).order_by('id')
+                return queryset.count(), list(queryset[:5])
+
+            print(f'search={term!r}: indexed p50 {measure(search, args.repeat)[0]:.2f}ms, '
+                  f'icontains p50 {measure(scan, args.repeat)[0]:.2f}ms')
+            if connection.vendor == 'postgresql':
+                print(explain(search_menu_items(MenuItem.objects.all(), term)[:5]))
+            else:
+                from LittleLemonAPI.search import FTS_TABLE, _fts_expression, search_words
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN QUERY PLAN SELECT rowid FROM "{FTS_TABLE}" WHERE "{FTS_TABLE}" MATCH %s',
+                                   [_fts_expression(search_words(term))])
+                    print('\n'.join(str(row[-1]) for row in cursor.fetchall()))
+            print()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Fetching the whole menu: walking /api/menu-items five at a time vs one /api/menu/snapshot.
+
+    python -m benchmarks.menu_snapshot --sizes 100 1000 10000
+
+The walk is timed with the catalog cache already warm, which is the best
+case for it. The snapshot is timed for the first request after a catalog
+change, which renders and compresses it, and then for the requests after.
+"""
+import argparse
+import tempfile
+import time
+from unittest.mock import patch
+
+from benchmarks.menu_search import seed_menu
+from benchmarks.utils import measure, setup_django, test_database
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import Client
+    from LittleLemonAPI.caching import bump_catalog_version
+    from LittleLemonAPI.models import Category, MenuItem
+    from LittleLemonAPI.views import MenuItemView
+
+    MenuItemView.throttle_classes = ()
+    client = Client()
+
+    def walk():
+        page, requests = 1, 0
+        while True:
+            response = client.get('/api/menu-items', {'perpage': 5, 'page': page})
+            requests += 1
+            if not response.data['next']:
+                return requests
+            page += 1
+
+    def snapshot(**headers):
+        response = client.get('/api/menu/snapshot', **headers)
+        return response, b''.join(response.streaming_content) if response.streaming else b''
+
+    with test_database(), tempfile.TemporaryDirectory() as directory, patch('LittleLemonAPI.snapshots.MENU_SNAPSHOT_DIR', directory):
+        print(f'{"items":>6} {"walk":>16} {"first snapshot":>15} {"snapshot p50":>13} {"p95":>8} {"304 p50":>8}  {"json / gzip / br":>24}')
+        for size in sorted(args.sizes):
+            MenuItem.objects.all().delete()
+            Category.objects.all().delete()
+            seed_menu(size, max(size // 100, 5))
+            bump_catalog_version()
+
+            walk()
+            start = time.perf_counter()
+            requests = walk()
+            walked = (time.perf_counter() - start) * 1000
+
+            bump_catalog_version()
+            start = time.perf_counter()
+            response, _ = snapshot(HTTP_ACCEPT_ENCODING='br')
+            first = (time.perf_counter() - start) * 1000
+            p50, p95 = measure(lambda: snapshot(HTTP_ACCEPT_ENCODING='br'), args.repeat)
+            not_modified, _ = measure(lambda: snapshot(HTTP_ACCEPT_ENCODING='br', HTTP_IF_NONE_MATCH=response['ETag']), args.repeat)
+            sizes = ' / '.join(f'{len(snapshot(HTTP_ACCEPT_ENCODING=encoding)[1]) / 1024:.0f}K' for encoding in ('', 'gzip', 'br'))
+            print(f'{size:>6} {walked:>7.0f}ms ({requests:>4}) {first:>13.1f}ms {p50:>11.3f}ms {p95:>6.3f}ms {not_modified:>6.3f}ms  {sizes:>24}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""Cost of the request metrics: the same requests with and without RequestMetricsMiddleware.
+
+    python -m benchmarks.metrics --repeat 500
+"""
+import argparse
+
+from benchmarks.utils import measure, setup_django, test_database
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=500)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+    from LittleLemonAPI.metrics import record_query
+    from LittleLemonAPI.models import Category, MenuItem, Order
+    from LittleLemonAPI.views import MenuItemView, OrderView
+
+    MenuItemView.throttle_classes = OrderView.throttle_classes = ()
+    without = [name for name in settings.MIDDLEWARE if not name.endswith('RequestMetricsMiddleware')]
+
+    with test_database():
+        user = User.objects.create_user(username='customer', password='password')
+        category = Category.objects.create(slug='mains', title='Mains')
+        MenuItem.objects.bulk_create(MenuItem(title=f'Item {i}', price=9.99, featured=False, category=category) for i in range(50))
+        Order.objects.bulk_create(Order(user=user, total=9.99) for _ in range(50))
+        connection.ensure_connection()
+
+        print(f'{"endpoint":<20} {"metrics":<8} {"p50":>9} {"p95":>9}')
+        for url in ('/api/menu-items', '/api/orders'):
+            for enabled in (False, True):
+                with override_settings(MIDDLEWARE=settings.MIDDLEWARE if enabled else without):
+                    wrappers = connection.execute_wrappers
+                    if not enabled:
+                        connection.execute_wrappers = [wrapper for wrapper in wrappers if wrapper is not record_query]
+                    client = APIClient()
+                    client.force_authenticate(user=user)
+                    p50, p95 = measure(lambda: client.get(url), args.repeat)
+                    connection.execute_wrappers = wrappers
+                print(f'{url:<20} {"on" if enabled else "off":<8} {p50:>7.3f}ms {p95:>7.3f}ms')
+
+if __name__ == '__main__':
+    main()
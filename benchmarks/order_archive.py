@@ -0,0 +1,94 @@
+"""Manager order lists as delivered history grows, with and without archive_orders.
+
+    python -m benchmarks.order_archive --sizes 5000 50000 500000
+
+Every size starts over with the same 1000 recent orders, a third of them
+pending, plus `size` delivered orders spread over the three years before.
+The lists are timed with all of that history in the Order table, then
+again after archive_orders has moved it out. A list with a date filter a
+year back reads the archive as well.
+"""
+import argparse
+import time
+from datetime import timedelta
+
+from benchmarks.utils import explicit_order_dates, measure, setup_django, test_database
+
+HOT_ORDERS = 1000
+
+def clear_orders():
+    from django.db import connection
+    from LittleLemonAPI.models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+    with connection.cursor() as cursor:
+        for model in (OrderItem, Order, ArchivedOrderItem, ArchivedOrder):
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)}')
+
+def seed(size, customer, menu_item, batch_size=10000):
+    from django.db import transaction
+    from django.utils import timezone
+    from LittleLemonAPI.models import Order, OrderItem
+
+    now = timezone.now()
+    history_start = now - timedelta(days=3 * 365 + 30)
+    step = timedelta(days=3 * 365) / max(size, 1)
+    orders = [(history_start + step * i, True) for i in range(size)]
+    orders += [(now - timedelta(minutes=40 * i), i % 3 != 0) for i in range(HOT_ORDERS)]
+    with explicit_order_dates():
+        for offset in range(0, len(orders), batch_size):
+            with transaction.atomic():
+                created = Order.objects.bulk_create(
+                    Order(user=customer, total=10, status=delivered, date=date) for date, delivered in orders[offset:offset + batch_size]
+                )
+                OrderItem.objects.bulk_create(
+                    OrderItem(order=order, menuitem=menu_item, quantity=1, unit_price=10, price=10) for order in created
+                )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5000, 50000, 500000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import Group, User
+    from django.utils import timezone
+    from rest_framework.test import APIClient
+    from LittleLemonAPI.archive import archive_cutoff, archive_orders, vacuum_hot_tables
+    from LittleLemonAPI.models import Category, MenuItem
+    from LittleLemonAPI.views import OrderView
+
+    OrderView.throttle_classes = ()
+    year_ago = (timezone.localdate() - timedelta(days=365)).strftime('%d-%m-%Y')
+    lists = [
+        ('all', {}),
+        ('pending', {'status': 'false'}),
+        ('a year ago', {'date': year_ago}),
+    ]
+
+    with test_database():
+        manager = User.objects.create_user(username='manager', password='password')
+        manager.groups.add(Group.objects.create(name='Manager'))
+        customer = User.objects.create_user(username='customer', password='password')
+        category = Category.objects.create(slug='mains', title='Mains')
+        menu_item = MenuItem.objects.create(title='Soup', price=10, featured=False, category=category)
+        client = APIClient()
+        client.force_authenticate(user=manager)
+
+        print(f'{"history":>9} {"list":<11} {"unarchived p50":>15} {"archived p50":>13} {"archived p95":>13}')
+        for size in sorted(args.sizes):
+            clear_orders()
+            seed(size, customer, menu_item)
+            unarchived = {name: measure(lambda: client.get('/api/orders', params), args.repeat)[0] for name, params in lists}
+            start = time.perf_counter()
+            archived_count = sum(archive_orders(archive_cutoff()))
+            # As the archive_orders command does
+            vacuum_hot_tables()
+            elapsed = time.perf_counter() - start
+            for name, params in lists:
+                p50, p95 = measure(lambda: client.get('/api/orders', params), args.repeat)
+                print(f'{size:>9} {name:<11} {unarchived[name]:>13.2f}ms {p50:>11.2f}ms {p95:>11.2f}ms')
+            print(f'{"":>9} archived {archived_count} orders in {elapsed:.1f}s')
+
+if __name__ == '__main__':
+    main()
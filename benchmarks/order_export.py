@@ -0,0 +1,65 @@
+"""Time to first byte and peak memory of the streaming order export.
+
+    python -m benchmarks.order_export --sizes 1000 100000 1000000
+
+Both should stay flat as the number of orders grows; total time grows
+linearly.
+"""
+import argparse
+import time
+import tracemalloc
+
+from benchmarks.order_pagination import seed_orders
+from benchmarks.utils import setup_django, test_database
+
+def seed_items(menu_item, batch_size=10000):
+    from LittleLemonAPI.models import Order, OrderItem
+
+    while True:
+        order_ids = list(Order.objects.filter(orderitem__isnull=True).values_list('id', flat=True)[:batch_size])
+        if not order_ids:
+            return
+        OrderItem.objects.bulk_create(
+            OrderItem(order_id=order_id, menuitem=menu_item, quantity=1, unit_price=10, price=10) for order_id in order_ids
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import Group, User
+    from rest_framework.test import APIClient
+    from LittleLemonAPI.models import Category, MenuItem
+    from LittleLemonAPI.views import OrderExportView
+
+    OrderExportView.throttle_classes = ()
+
+    with test_database():
+        manager = User.objects.create_user(username='manager', password='password')
+        manager.groups.add(Group.objects.create(name='Manager'))
+        menu_item = MenuItem.objects.create(title='Soup', price=10, featured=False, category=Category.objects.create(slug='mains', title='Mains'))
+        client = APIClient()
+        client.force_authenticate(user=manager)
+
+        print(f'{"orders":>10} {"first byte":>11} {"total":>10} {"MB":>8} {"peak memory":>12}')
+        for size in sorted(args.sizes):
+            seed_orders(size, manager)
+            seed_items(menu_item)
+            tracemalloc.start()
+            start = time.perf_counter()
+            response = client.get(f'/api/orders/export.{args.format}')
+            chunks = iter(response.streaming_content)
+            size_bytes = len(next(chunks))
+            first_byte = time.perf_counter() - start
+            for chunk in chunks:
+                size_bytes += len(chunk)
+            total = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f'{size:>10} {first_byte * 1000:>9.1f}ms {total:>9.2f}s {size_bytes / 2**20:>8.1f} {peak / 2**20:>10.1f}MB')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Page 1000 of the manager order list: OFFSET pagination vs ?cursor=.
+
+    python -m benchmarks.order_pagination --sizes 10000 100000 1000000
+"""
+import argparse
+from datetime import timedelta
+
+from benchmarks.utils import explicit_order_dates, measure, setup_django, test_database
+
+PAGE = 1000
+PERPAGE = 5
+
+def seed_orders(count, user, batch_size=10000):
+    from django.utils import timezone
+    from LittleLemonAPI.models import Order
+
+    start = timezone.now() - timedelta(days=365)
+    existing = Order.objects.count()
+    with explicit_order_dates():
+        for offset in range(existing, count, batch_size):
+            Order.objects.bulk_create(
+                Order(user=user, total=10, date=start + timedelta(seconds=i))
+                for i in range(offset, min(offset + batch_size, count))
+            )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 500000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import Group, User
+    from rest_framework.test import APIClient
+    from LittleLemonAPI.models import Order
+    from LittleLemonAPI.paginations import OrderCursorPagination
+    from LittleLemonAPI.views import OrderView
+
+    OrderView.throttle_classes = ()
+
+    with test_database():
+        manager = User.objects.create_user(username='manager', password='password')
+        manager.groups.add(Group.objects.create(name='Manager'))
+        client = APIClient()
+        client.force_authenticate(user=manager)
+
+        print(f'{"orders":>10} {"offset p50":>11} {"offset p95":>11} {"cursor p50":>11} {"cursor p95":>11}')
+        for size in sorted(args.sizes):
+            seed_orders(size, manager)
+            # Cursor positioned where page 1000 starts
+            before = Order.objects.order_by('date', 'id')[(PAGE - 1) * PERPAGE - 1]
+            cursor = OrderCursorPagination(PERPAGE).encode_cursor(
+                'date', Order._meta.get_field('date').value_to_string(before), before.pk)
+
+            offset = measure(lambda: client.get('/api/orders', {'page': PAGE, 'perpage': PERPAGE, 'ordering': 'date'}), args.repeat)
+            keyset = measure(lambda: client.get('/api/orders', {'cursor': cursor, 'perpage': PERPAGE}), args.repeat)
+            print(f'{size:>10} {offset[0]:>9.2f}ms {offset[1]:>9.2f}ms {keyset[0]:>9.2f}ms {keyset[1]:>9.2f}ms')
+
+if __name__ == '__main__':
+    main()
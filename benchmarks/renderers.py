@@ -0,0 +1,52 @@
+"""Rendering menu item and order listings: DRF's JSONRenderer vs ORJSONRenderer and MessagePack.
+
+    python -m benchmarks.renderers --rows 1000 --repeat 50
+
+The data is loaded once; only the render call is timed.
+"""
+import argparse
+
+from benchmarks.utils import measure, setup_django, test_database
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from rest_framework.renderers import JSONRenderer
+    from LittleLemonAPI.models import Category, MenuItem, Order, OrderItem
+    from LittleLemonAPI.renderers import MessagePackRenderer, ORJSONRenderer
+    from LittleLemonAPI.serializers import MenuItemSerializer, OrderItemSerializer, OrderSerializer
+
+    with test_database():
+        user = User.objects.create_user(username='customer', password='password')
+        category = Category.objects.create(slug='mains', title='Mains')
+        items = MenuItem.objects.bulk_create(
+            MenuItem(title=f'Item {i}', price=9.99, featured=i % 2 == 0, category=category) for i in range(args.rows)
+        )
+        orders = Order.objects.bulk_create(Order(user=user, delivery_crew=user, total=29.97) for _ in range(args.rows // 3))
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, menuitem=items[i], quantity=1, unit_price=9.99, price=9.99) for order in orders for i in range(3)
+        )
+
+        order_data = []
+        for order in Order.objects.select_related('delivery_crew').prefetch_related('orderitem_set__menuitem__category'):
+            data = OrderSerializer(order).data
+            data['order_items'] = OrderItemSerializer(order.orderitem_set.all(), many=True).data
+            order_data.append(data)
+        datasets = [
+            ('menu items', MenuItemSerializer(MenuItem.objects.select_related('category'), many=True).data),
+            ('orders (x3 items)', order_data),
+        ]
+        renderers = [('JSONRenderer', JSONRenderer()), ('ORJSONRenderer', ORJSONRenderer()), ('MessagePack', MessagePackRenderer())]
+        print(f'{"data":<20} {"renderer":<16} {"p50":>8} {"bytes":>9}')
+        for name, data in datasets:
+            for renderer_name, renderer in renderers:
+                p50, _ = measure(lambda: renderer.render(data), args.repeat)
+                print(f'{name:<20} {renderer_name:<16} {p50:>6.2f}ms {len(renderer.render(data)):>9}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Serializing 1000 rows: DRF serializers over model instances vs the values() row serializers.
+
+    python -m benchmarks.serializers --rows 1000 --repeat 20
+
+Both sides include the queries that load the rows.
+"""
+import argparse
+
+from benchmarks.utils import measure, setup_django, test_database
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from LittleLemonAPI.fast_serializers import cart_rows, menu_item_rows, order_rows
+    from django.db.models import Prefetch
+    from LittleLemonAPI.loaders import load_orders
+    from LittleLemonAPI.models import Cart, Category, MenuItem, Order, OrderItem
+    from LittleLemonAPI.serializers import CartSerializer, MenuItemSerializer, OrderItemSerializer, OrderSerializer
+
+    def drf_orders():
+        orders = []
+        order_items = Prefetch('orderitem_set', queryset=OrderItem.objects.select_related('menuitem__category').order_by('id'))
+        for order in Order.objects.select_related('delivery_crew').prefetch_related(order_items).order_by('id'):
+            data = OrderSerializer(order).data
+            data['order_items'] = OrderItemSerializer(order.orderitem_set.all(), many=True).data
+            orders.append(data)
+        return orders
+
+    with test_database():
+        user = User.objects.create_user(username='customer', password='password')
+        category = Category.objects.create(slug='mains', title='Mains')
+        items = MenuItem.objects.bulk_create(
+            MenuItem(title=f'Item {i}', price=9.99, featured=i % 2 == 0, category=category) for i in range(args.rows)
+        )
+        Cart.objects.bulk_create(Cart(user=user, menuitem=item, quantity=2, unit_price=9.99, price=19.98) for item in items)
+        orders = Order.objects.bulk_create(Order(user=user, delivery_crew=user, total=29.97) for _ in range(args.rows // 3))
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, menuitem=items[i], quantity=1, unit_price=9.99, price=9.99) for order in orders for i in range(3)
+        )
+
+        cases = [
+            ('menu items', lambda: MenuItemSerializer(MenuItem.objects.select_related('category').order_by('id'), many=True).data,
+             lambda: menu_item_rows.serialize(menu_item_rows.values(MenuItem.objects.order_by('id')))),
+            ('cart', lambda: CartSerializer(Cart.objects.select_related('menuitem__category').order_by('id'), many=True).data,
+             lambda: cart_rows.serialize(cart_rows.values(Cart.objects.order_by('id')))),
+            ('orders (x3 items)', drf_orders, lambda: load_orders(order_rows.values(Order.objects.order_by('id')))),
+        ]
+        print(f'{"rows":<20} {"DRF p50":>9} {"rows p50":>9} {"speedup":>8}')
+        for name, drf, fast in cases:
+            before, _ = measure(drf, args.repeat)
+            after, _ = measure(fast, args.repeat)
+            print(f'{name:<20} {before:>7.1f}ms {after:>7.1f}ms {before / after:>7.1f}x')
+
+if __name__ == '__main__':
+    main()
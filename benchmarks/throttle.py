@@ -0,0 +1,55 @@
+"""Per-request cost of a throttle check: DRF's history list vs the sliding window.
+
+The history list holds one timestamp per request in the window, so its cost
+grows with the rate; the sliding window keeps two counters per key.
+
+    python -m benchmarks.throttle --rates 60 1000 10000
+"""
+import argparse
+
+from benchmarks.utils import measure, setup_django, test_database
+
+STORES = [
+    'LittleLemonAPI.throttles.MemoryThrottleStore',
+    'LittleLemonAPI.throttles.CacheThrottleStore',
+    'LittleLemonAPI.throttles.DatabaseThrottleStore',
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rates', type=int, nargs='+', default=[60, 1000, 10000], help='Requests per minute')
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from types import SimpleNamespace
+    from django.contrib.auth.models import User
+    from django.core.cache import cache
+    from django.test.utils import override_settings
+    from rest_framework import throttling
+    from LittleLemonAPI import throttles
+
+    with test_database():
+        request = SimpleNamespace(user=User.objects.create_user(username='customer'), META={})
+
+        def check(throttle_class):
+            throttle = throttle_class()
+            throttle.allow_request(request, None)
+
+        print(f'{"throttle":<42} {"rate":>7} {"p50":>9} {"p95":>9}')
+        for rate in args.rates:
+            candidates = [('UserRateThrottle (DRF, cache history)', throttling.UserRateThrottle, None)]
+            candidates += [(f'SlidingWindow {store.rsplit(".", 1)[1]}', throttles.UserRateThrottle, store) for store in STORES]
+            for name, base, store in candidates:
+                # The limit stays above the calls made, so every check is allowed
+                throttle_class = type('Benchmark', (base,), {'rate': f'{rate * 10}/min'})
+                cache.clear()
+                # Fill the window to the rate being measured
+                with override_settings(THROTTLE_STORE=store or STORES[0]):
+                    for _ in range(rate):
+                        check(throttle_class)
+                    p50, p95 = measure(lambda: check(throttle_class), args.repeat)
+                print(f'{name:<42} {rate:>5}/m {p50 * 1000:>7.1f}us {p95 * 1000:>7.1f}us')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Requests/sec against a running server, for comparing serving setups.
+
+Start the server under test with throttling effectively off, for example
+
+    THROTTLE_ANON_RATE=1000000/minute THROTTLE_USER_RATE=1000000/minute \\
+    THROTTLE_FIFTEEN_RATE=1000000/minute python manage.py runserver
+
+or the same environment with ``gunicorn -c gunicorn.conf.py``. Both work
+with the default Postgres settings or with DB_ENGINE=sqlite3. Then run
+
+    python -m benchmarks.throughput --url http://localhost:8000 \\
+        --username admin --password secret --concurrency 32 --duration 15
+
+and compare the numbers between setups.
+"""
+import argparse
+import http.client
+import json
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+DEFAULT_PATHS = ['/api/menu-items', '/api/orders']
+
+def login(url, username, password):
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80)
+    body = json.dumps({'username': username, 'password': password})
+    conn.request('POST', '/api/auth/token/login/', body, {'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    data = json.loads(response.read())
+    if response.status != 200:
+        raise SystemExit(f'Login failed: {data}')
+    return data['auth_token']
+
+def run(url, path, token, concurrency, duration):
+    parts = urlsplit(url)
+    headers = {'Authorization': f'Token {token}'} if token else {}
+    deadline = time.monotonic() + duration
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def client():
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        local_latencies, local_errors = [], 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    local_errors += 1
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+                continue
+            local_latencies.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)] if latencies else 0
+    return {
+        'path': path,
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'rps': len(latencies) / duration,
+        'p50_ms': statistics.median(latencies) if latencies else 0,
+        'p99_ms': p99,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    parser.add_argument('--paths', nargs='+', default=DEFAULT_PATHS)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results.')
+    args = parser.parse_args()
+
+    token = login(args.url, args.username, args.password) if args.username else None
+    results = [run(args.url, path, token, args.concurrency, args.duration) for path in args.paths]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f'{"path":<20} {"req/s":>9} {"p50":>9} {"p99":>9} {"errors":>7}')
+    for result in results:
+        print(f'{result["path"]:<20} {result["rps"]:>9.1f} {result["p50_ms"]:>7.2f}ms {result["p99_ms"]:>7.2f}ms {result["errors"]:>7}')
+
+if __name__ == '__main__':
+    main()
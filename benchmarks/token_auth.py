@@ -0,0 +1,45 @@
+"""Warm token-authenticated requests: TokenAuthentication vs CachedTokenAuthentication.
+
+    python -m benchmarks.token_auth --repeat 200
+"""
+import argparse
+
+from benchmarks.utils import measure, setup_django, test_database
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.authentication import TokenAuthentication
+    from rest_framework.authtoken.models import Token
+    from rest_framework.test import APIClient
+    from LittleLemonAPI.authentication import CachedTokenAuthentication, token_cache
+    from LittleLemonAPI.views import CartView
+
+    CartView.throttle_classes = ()
+
+    with test_database():
+        user = User.objects.create_user(username='customer', password='password')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+
+        print(f'{"authentication":<28} {"queries":>8} {"auth queries":>13} {"p50":>9} {"p95":>9}')
+        for authentication in (TokenAuthentication, CachedTokenAuthentication):
+            CartView.authentication_classes = (authentication,)
+            token_cache.reset_stats()
+            client.get('/api/cart/menu-items')
+            with CaptureQueriesContext(connection) as queries:
+                client.get('/api/cart/menu-items')
+            query_count = len(queries)
+            auth_queries = sum('authtoken_token' in q['sql'] for q in queries.captured_queries)
+            p50, p95 = measure(lambda: client.get('/api/cart/menu-items'), args.repeat)
+            print(f'{authentication.__name__:<28} {query_count:>8} {auth_queries:>13} {p50:>7.2f}ms {p95:>7.2f}ms')
+        print('token cache:', token_cache.stats())
+
+if __name__ == '__main__':
+    main()
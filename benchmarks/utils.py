@@ -0,0 +1,50 @@
+"""Shared setup for the benchmark scripts.
+
+Every benchmark runs against a throwaway test database created from the
+configured DATABASES, so it never touches real data. Run them from the
+project root, e.g. ``python -m benchmarks.order_pagination``.
+"""
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+def setup_django():
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings')
+    import django
+    django.setup()
+
+@contextmanager
+def test_database():
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+def explicit_order_dates():
+    """Let bulk inserts set Order.date instead of auto_now_add stamping now()."""
+    from LittleLemonAPI.seeding import explicit_order_dates
+
+    return explicit_order_dates()
+
+def measure(func, repeat=20):
+    """Return (p50, p95) wall time of func() in milliseconds."""
+    func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[max(0, int(len(timings) * 0.95) - 1)]
@@ -0,0 +1,28 @@
+# Production server settings, overridable from the environment:
+#
+#   gunicorn -c gunicorn.conf.py                      WSGI, threaded workers
+#   GUNICORN_ASGI=1 gunicorn -c gunicorn.conf.py      ASGI, uvicorn workers
+import multiprocessing
+import os
+
+asgi = os.environ.get('GUNICORN_ASGI', '').lower() in ('1', 'true', 'yes', 'on')
+
+if asgi:
+    wsgi_app = 'LittleLemon.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    # Under ASGI every in-flight request has its own connection, which
+    # persistent connections would leak; pool with PgBouncer instead.
+    os.environ.setdefault('DB_CONN_MAX_AGE', '0')
+else:
+    wsgi_app = 'LittleLemon.wsgi:application'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Recycle workers now and then to bound memory growth.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-') or None